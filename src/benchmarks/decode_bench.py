@@ -0,0 +1,65 @@
+import sys
+import json
+import time
+import argparse
+from types import SimpleNamespace
+from core.notification_hub import SIM_MI_CHAR, SIM_O2_CHAR
+from core import NotificationHub, Measurement, MiData, O2Data
+
+# Run from the src directory: python -m benchmarks.decode_bench
+
+MI_CHAR = SimpleNamespace(uuid=SIM_MI_CHAR)
+O2_CHAR = SimpleNamespace(uuid=SIM_O2_CHAR)
+
+MI_PACKET = bytearray([0x2C, 0x09, 0x3A, 0x8C, 0x0B])                              # 23.48C, 58%, 2956mV
+O2_PACKET = bytearray([0x55, 0x00, 0xFF, 0x00, 0x00, 0x00, 0x00, 0x61, 0x48, 0x00])  # 97%, 72 BPM
+
+def legacy_handle_notify(characteristic, data: bytearray):
+    # Per-packet pydantic construction with one int.from_bytes per field (previous hub implementation)
+    ts = time.time()
+    if characteristic.uuid == MI_CHAR.uuid:
+        temp = int.from_bytes(data[0:2], byteorder=sys.byteorder, signed=True) / 100
+        humid = int.from_bytes(data[2:3], byteorder=sys.byteorder)
+        voltage = int.from_bytes(data[3:5], byteorder=sys.byteorder) / 1000
+        bat = min(int(round((voltage - 2.1),2) * 100), 100)
+        return Measurement(source="XIAOMI", data=MiData(timestamp=ts, temperature=temp, humidity=humid, battery=bat))
+    elif characteristic.uuid == O2_CHAR.uuid:
+        if len(data) < 3: return
+        spo2 = data[7]
+        pr = int.from_bytes(data[8:10], byteorder=sys.byteorder)
+        return Measurement(source="O2RING", data=O2Data(timestamp=ts, spo2=spo2, pr=pr))
+
+def measure(handler, characteristic, packet, duration: float):
+    count = 0
+    batch = 1000
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        for _ in range(batch):
+            handler(characteristic, packet)
+        count += batch
+        now = time.perf_counter()
+        if now >= end:
+            return count / (now - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Packets decoded per second, before and after the struct decode path")
+    parser.add_argument("-d", "--duration", type=float, default=2.0, help="Duration (seconds) of each measurement")
+    args = parser.parse_args()
+
+    hub = NotificationHub(None, False)
+
+    results = {}
+    for device, characteristic, packet in (("XIAOMI", MI_CHAR, MI_PACKET), ("O2RING", O2_CHAR, O2_PACKET)):
+        before = measure(legacy_handle_notify, characteristic, packet, args.duration)
+        after = measure(hub.handle_notify, characteristic, packet, args.duration)
+        results[device] = {
+            "before_pps": round(before),
+            "after_pps": round(after),
+            "speedup": round(after / before, 2),
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
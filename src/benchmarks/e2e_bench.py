@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+import websockets
+from core import PipelineManager, SimulatedBackend, set_json_encoder
+from core.encoding import ENCODERS
+from core.wire import FRAMINGS, FRAME_HEADER, unpack_frame
+from services import APIServer, SocketServer, WebSocketServer, FileLogger
+
+# Run from the src directory: python -m benchmarks.e2e_bench --devices 20 --rate 500 --clients 4
+# Simulated packets flow through the real notify callback, NotificationHub, sinks and servers.
+# Loopback clients run in a separate process so their parsing cost does not count against the server.
+
+HOST = "127.0.0.1"
+
+def percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    values = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+async def socket_consumer(port: int, framing: str, latencies: list[float], ready: asyncio.Event):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    ack = b"FRAMING " + framing.encode() + b"\n"
+    writer.write(ack)
+    await writer.drain()
+    await reader.readuntil(ack)
+    ready.set()
+    try:
+        while True:
+            if framing == "json":
+                line = await reader.readline()
+                if not line:
+                    break
+                timestamp = json.loads(line)["data"]["timestamp"]
+            else:
+                (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                timestamp = unpack_frame(await reader.readexactly(length)).data.timestamp
+            latencies.append(time.time() - timestamp)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+async def ws_consumer(port: int, latencies: list[float], ready: asyncio.Event):
+    async with websockets.connect(f"ws://{HOST}:{port}", max_queue=None) as ws:
+        ready.set()
+        try:
+            async for message in ws:
+                latencies.append(time.time() - json.loads(message)["data"]["timestamp"])
+        except websockets.ConnectionClosed:
+            pass
+
+def client_process(socket_port: int, ws_port: int, clients: int, framing: str, connection):
+    async def main():
+        socket_latencies = [[] for _ in range(clients)]
+        ws_latencies = [[] for _ in range(clients)]
+        ready = [asyncio.Event() for _ in range(clients * 2)]
+        tasks = [asyncio.create_task(socket_consumer(socket_port, framing, socket_latencies[i], ready[i])) for i in range(clients)]
+        tasks += [asyncio.create_task(ws_consumer(ws_port, ws_latencies[i], ready[clients + i])) for i in range(clients)]
+        await asyncio.gather(*(event.wait() for event in ready))
+        connection.send("ready")
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = {}
+        for name, latencies in (("socket", socket_latencies), ("websocket", ws_latencies)):
+            merged = [latency for client in latencies for latency in client]
+            results[name] = {
+                "clients": clients,
+                "delivered": len(merged),
+                "delivered_per_client": round(len(merged) / clients) if clients else 0,
+                **percentiles(merged),
+            }
+        connection.send(results)
+    asyncio.run(main())
+
+async def run(args) -> dict:
+    if args.json_encoder:
+        set_json_encoder(args.json_encoder)
+
+    backend = SimulatedBackend(args.devices, args.rate, args.kind)
+    manager = PipelineManager(backend.addresses, backend=backend, max_connecting=args.devices)
+    hub = manager.hub
+    hub.set_batching(args.batch_size, args.batch_interval)
+
+    published = 0
+    def count(_data):
+        nonlocal published
+        published += 1
+    hub.register(count)
+
+    output_dir = tempfile.mkdtemp(prefix="e2e_bench_")
+    logger = FileLogger(os.path.join(output_dir, "bench"), "w")
+    api_server = APIServer()
+    socket_server = SocketServer(HOST, 0, framing=args.framing)
+    ws_server = WebSocketServer(HOST, 0)
+    await socket_server.start()
+    await ws_server.start()
+    for sub in (logger.sub, api_server.sub, socket_server.sub, ws_server.sub):
+        hub.register(sub)
+    socket_port = socket_server.server.sockets[0].getsockname()[1]
+    ws_port = list(ws_server.server.sockets)[0].getsockname()[1]
+
+    context = multiprocessing.get_context("spawn")
+    parent_end, child_end = context.Pipe()
+    clients = context.Process(target=client_process, args=(socket_port, ws_port, args.clients, args.framing, child_end))
+    clients.start()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, parent_end.recv)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    await manager.start()
+    await asyncio.sleep(args.duration)
+    await manager.close()
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    # Let queued messages drain before the connections are closed
+    await asyncio.sleep(args.drain)
+    await socket_server.close()
+    await ws_server.close()
+    logger.close()
+    transports = await loop.run_in_executor(None, parent_end.recv)
+    clients.join()
+
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "config": {
+            "devices": args.devices,
+            "rate_per_device": args.rate,
+            "kind": args.kind,
+            "duration_s": args.duration,
+            "clients_per_transport": args.clients,
+            "framing": args.framing,
+            "batch_size": args.batch_size,
+        },
+        "published": published,
+        "packets_per_s": round(published / elapsed),
+        "cpu_s": round(cpu, 3),
+        "cpu_percent": round(100 * cpu / elapsed, 1),
+        "peak_rss_mb": round(usage_after.ru_maxrss / 1024, 1),
+        "transports": transports,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput and latency of the hub and services")
+    parser.add_argument("--devices", type=int, default=10, help="Number of simulated devices")
+    parser.add_argument("--rate", type=float, default=100.0, help="Packets per second per simulated device")
+    parser.add_argument("--kind", type=str, default="mixed", choices=["mi", "o2", "mixed"], help="Type of simulated devices")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duration (seconds) of the measured run")
+    parser.add_argument("--drain", type=float, default=1.0, help="Time (seconds) allowed for queued messages to reach clients")
+    parser.add_argument("--clients", type=int, default=2, help="Loopback clients per transport (Socket and WebSocket)")
+    parser.add_argument("--framing", type=str, choices=list(FRAMINGS), default="json", help="Framing used by the socket clients")
+    parser.add_argument("--json-encoder", type=str, choices=list(ENCODERS), help="JSON encoder shared by all services")
+    parser.add_argument("--batch-size", type=int, help="Enable hub batching with this batch size")
+    parser.add_argument("--batch-interval", type=float, help="Enable hub batching with this maximum age (seconds)")
+    parser.add_argument("-o", "--output", type=str, help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
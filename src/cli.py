@@ -1,9 +1,17 @@
 import os
+import signal
 import argparse
 import asyncio
 from enum import Enum, auto
-from services import APIServer, SocketServer, WebSocketServer, FileLogger
-from core import SensorPipeline
+from services import APIServer, SocketServer, WebSocketServer, MulticastPublisher, SharedMemoryPublisher, FileLogger, ParquetLogger, RoutingLogger
+from core import SensorPipeline, PipelineManager, AdvertisementScanner, NotificationHub, SimulatedBackend, SQLiteStore, set_json_encoder, metrics
+from core.simulator import DEVICE_KINDS
+from core.manager import load_addresses
+from core.encoding import ENCODERS
+from core.queues import OVERFLOW_POLICIES, DROP_OLDEST
+from core.wire import FRAMINGS
+from services.file_logger import ROTATION_PERIODS, COMPRESSIONS
+from services.api_server import API_MODES
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,12 +19,39 @@ load_dotenv()
 class AppState(Enum):
     SCAN = auto()
     CONNECT = auto()
+    MONITOR = auto()
+    PASSIVE = auto()
     QUIT = auto()
 
 SOCKET_HOST = os.getenv("SOCKET_HOST")
 SOCKET_PORT = int(os.getenv("SOCKET_PORT", '55555'))
 WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST")
 WEBSOCKET_PORT = int(os.getenv("WEBSOCKET_PORT", '80'))
+MULTICAST_GROUP = os.getenv("MULTICAST_GROUP", "239.255.42.99")
+MULTICAST_PORT = int(os.getenv("MULTICAST_PORT", '55556'))
+
+def flush_on_signals(logger: FileLogger | ParquetLogger | RoutingLogger):
+    # Buffered rows are written out before the process terminates on these signals.
+    # Handlers run on the event loop so they never interrupt a row half way through.
+    loop = asyncio.get_running_loop()
+    def handle(signum):
+        logger.close()
+        loop.remove_signal_handler(signum)
+        os.kill(os.getpid(), signum)
+
+    for name in ("SIGINT", "SIGTERM", "SIGHUP"):
+        if hasattr(signal, name):
+            try:
+                loop.add_signal_handler(getattr(signal, name), handle, getattr(signal, name))
+            except NotImplementedError:
+                # Windows event loops do not support signal handlers, rows are still flushed on quit
+                return
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
 
 def parse_args():
     parser = argparse.ArgumentParser(prog="Monitor", description="Xiaomi Temperature and Humidity Monitor 2", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -24,22 +59,68 @@ def parse_args():
     # BLE Options
     parser.add_argument("-t", "--scan-timeout", type=float, default=10.0, help="Duration (seconds) of each scan to find BLE devices")
     parser.add_argument("-mac", "--mac-address", type=str, help="The MAC Address of the BLE device to connect to (enables end-to-end service)")
+    parser.add_argument("-macs", "--mac-addresses", type=str, nargs="+", help="MAC Addresses of several BLE devices to monitor concurrently")
+    parser.add_argument("-b", "--backend", type=str, choices=["ble", "sim"], default="ble", help="Use real BLE devices or simulated devices for load testing")
+    parser.add_argument("--sim-devices", type=int, default=1, help="Number of simulated devices (sim backend)")
+    parser.add_argument("--sim-rate", type=positive_float, default=1.0, help="Packets per second emitted by each simulated device (sim backend)")
+    parser.add_argument("--sim-kind", type=str, choices=DEVICE_KINDS, default="mi", help="Type of simulated devices (sim backend)")
+    parser.add_argument("--sim-recording", type=str, help="File of recorded hex packets replayed by simulated devices instead of synthetic data")
+    parser.add_argument("-p", "--passive", action="store_true", help="Read LYWSD03MMC data from BLE advertisements (ATC/PVVX or MiBeacon) without connecting")
+    parser.add_argument("--adv-record", type=str, help="File to record decoded BLE advertisements into (passive mode)")
+    parser.add_argument("--adv-replay", type=str, help="File of recorded BLE advertisements to replay instead of scanning (passive mode)")
+    parser.add_argument("-rc", "--reconnect", action="store_true", help="Automatically reconnect when a connected BLE device drops (always on with several devices)")
+    parser.add_argument("-wd", "--watchdog", type=float, help="Treat the connection as lost after this many seconds without data")
+    parser.add_argument("-df", "--devices-file", type=str, help="File listing one MAC Address per line of BLE devices to monitor concurrently")
     
     # Logging options
-    parser.add_argument("-o", "--output-file", type=str, default="monitor_data", help="The name of the CSV file to output data into")
+    parser.add_argument("-o", "--output-file", type=str, default="monitor_data", help="The name of the file to output data into")
+    parser.add_argument("-of", "--output-format", type=str, choices=["csv", "parquet"], default="csv", help="Output file format, Parquet writes one file per device type (requires pyarrow)")
+    parser.add_argument("-pd", "--per-device", action="store_true", help="Write one CSV file per device into the output directory (-o), always on with several devices or in passive mode")
+    parser.add_argument("--max-open-files", type=int, default=64, help="Maximum number of per-device CSV files kept open at once")
+    parser.add_argument("--row-group-size", type=int, default=65536, help="Readings per Parquet row group (parquet output)")
     parser.add_argument("-m", "--file-mode", type=str, choices=["w", "a"], default="w", help="Option to write or append to the output CSV file")
+    parser.add_argument("--log-buffer", type=int, help="Buffer this many bytes of CSV rows in memory before writing them to disk")
+    parser.add_argument("--log-flush-interval", type=float, help="Maximum time (seconds) CSV rows stay buffered before being written to disk")
+    parser.add_argument("--log-fsync", action="store_true", help="Force CSV data onto the disk (fsync) on every flush")
+    parser.add_argument("--rotate-size", type=int, help="Start a new CSV segment once the current one reaches this many bytes")
+    parser.add_argument("--rotate-every", type=str, choices=ROTATION_PERIODS, help="Start a new CSV segment every hour or day")
+    parser.add_argument("--log-compression", type=str, choices=list(COMPRESSIONS), help="Compress closed CSV segments in the background (zstd requires zstandard)")
     parser.add_argument("-i", "--interval", type=int, help="Time interval (seconds) between data transmissions (cannot be less than device minimum)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable visual logging of data in the terminal")
+    parser.add_argument("-bs", "--batch-size", type=int, help="Deliver data to batch-capable outputs in batches of this many readings")
+    parser.add_argument("--sub-queue-size", type=int, default=1024, help="Maximum number of readings queued for each asynchronous output (WebSocket server)")
+    parser.add_argument("--sub-overflow", type=str, choices=OVERFLOW_POLICIES, default=DROP_OLDEST, help="What to do when an asynchronous output's queue is full")
+    parser.add_argument("-bi", "--batch-interval", type=float, help="Maximum time (seconds) a reading waits in a batch before delivery")
     
     # Data transmission service options
     parser.add_argument("-api", "--enable-api", action="store_true", help="Enable data transmission via API server hosting")
     parser.add_argument('--api-url', type=str, help="IP address (host) of the API server ")
+    parser.add_argument("--api-mode", type=str, choices=API_MODES, default="loop", help="Serve the API on the program's event loop, or from worker threads")
+    parser.add_argument("--api-workers", type=int, default=1, help="Number of API server threads sharing the listening socket (thread mode)")
+    parser.add_argument("--history-size", type=int, default=86400, help="Maximum number of readings kept in the API server history")
+    parser.add_argument("--history-age", type=float, help="Maximum age (seconds) of readings kept in the API server history")
+    parser.add_argument("--history-db", type=str, help="SQLite database keeping the API server history across restarts (replaces the in-memory history)")
+    parser.add_argument("--metrics", action="store_true", help="Collect pipeline metrics and expose them at /metrics on the API server")
     parser.add_argument("-s", "--enable-socket", action="store_true", help="Enable data transmission via sockets")
     parser.add_argument("-th", '--tcp-host', type=str, help="IP Address (host) of the socket server")
     parser.add_argument("-tp", "--tcp-port", type=int, help="Port number of the socket server")
+    parser.add_argument("--tcp-queue-size", type=int, default=1024, help="Maximum number of messages queued per socket client")
+    parser.add_argument("--tcp-framing", type=str, choices=list(FRAMINGS), default="json", help="Default framing for socket clients that do not negotiate one")
+    parser.add_argument("--tcp-overflow", type=str, choices=OVERFLOW_POLICIES, default=DROP_OLDEST, help="What to do when a socket client's queue is full")
     parser.add_argument("-ws", "--enable-websocket", action="store_true", help="Enable data transmission via web sockets")
     parser.add_argument("-wsh", "--ws-host", type=str, help="IP Address (host) of the web socket server")
     parser.add_argument("-wsp", "--ws-port", type=int, help="Port number of the web socket server")
+    parser.add_argument("--ws-coalesce", type=float, help="Send each web socket client one JSON array per window (seconds) instead of one frame per reading")
+    parser.add_argument("--ws-compression", type=str, choices=["deflate", "none"], default="deflate", help="Compress web socket frames with permessage-deflate")
+    parser.add_argument("-mc", "--enable-multicast", action="store_true", help="Enable data transmission via UDP multicast datagrams")
+    parser.add_argument("--mc-group", type=str, help="Multicast group address the datagrams are sent to")
+    parser.add_argument("--mc-port", type=int, help="UDP port of the multicast group")
+    parser.add_argument("--mc-ttl", type=int, default=1, help="Number of router hops multicast datagrams may cross (1 keeps them on the LAN)")
+    parser.add_argument("--mc-interface", type=str, help="IP address of the network interface multicast datagrams are sent from")
+    parser.add_argument("-shm", "--enable-shm", action="store_true", help="Enable data transmission to local processes via shared memory ring buffers")
+    parser.add_argument("--shm-name", type=str, default="xiaomi_monitor", help="Prefix of the shared memory ring names, one ring per device type")
+    parser.add_argument("--shm-capacity", type=int, default=65536, help="Number of readings each shared memory ring holds before it wraps around")
+    parser.add_argument("--json-encoder", type=str, choices=list(ENCODERS), help="JSON encoder shared by all services (defaults to orjson when installed)")
 
     return parser.parse_args()
 
@@ -47,15 +128,56 @@ async def main(args):
     state = AppState.SCAN
     auto_connect = bool(args.mac_address)
 
-    pipeline = SensorPipeline(args.interval, args.verbose)
+    if args.json_encoder:
+        set_json_encoder(args.json_encoder)
+    if args.metrics:
+        metrics.enable()
+
+    addresses = list(args.mac_addresses or [])
+    if args.devices_file:
+        addresses += load_addresses(args.devices_file)
+
+    backend = None
+    if args.backend == "sim":
+        backend = SimulatedBackend(args.sim_devices, args.sim_rate, args.sim_kind, args.sim_recording)
+        if not addresses and not args.mac_address and args.sim_devices > 1:
+            addresses = backend.addresses
+
+    if args.passive:
+        hub = NotificationHub(args.interval, args.verbose)
+        scanner = AdvertisementScanner(hub, addresses or None, args.adv_record)
+        state = AppState.PASSIVE
+    elif addresses:
+        manager = PipelineManager(addresses, args.interval, args.verbose, watchdog=args.watchdog, backend=backend)
+        hub = manager.hub
+        state = AppState.MONITOR
+    else:
+        pipeline = SensorPipeline(args.interval, args.verbose, reconnect=args.reconnect, watchdog=args.watchdog, backend=backend)
+        hub = pipeline.hub
+    hub.set_batching(args.batch_size, args.batch_interval)
+    hub.set_dispatch(args.sub_queue_size, args.sub_overflow)
 
-    logger = FileLogger(args.output_file, args.file_mode)
-    pipeline.hub.register(logger.sub)
+    if args.output_format == "parquet":
+        logger = ParquetLogger(args.output_file, args.file_mode, args.row_group_size, args.log_flush_interval)
+    elif args.per_device or args.passive or len(addresses) > 1:
+        # Several devices never share one CSV file, it has a single header and no address column
+        if not args.per_device:
+            print(f"[Logger] Several devices are monitored, writing one CSV file per device into '{args.output_file}'.")
+        logger = RoutingLogger(args.output_file, args.file_mode, args.max_open_files, args.log_buffer, args.log_flush_interval, args.log_fsync,
+                               args.rotate_size, args.rotate_every, args.log_compression)
+    else:
+        logger = FileLogger(args.output_file, args.file_mode, args.log_buffer, args.log_flush_interval, args.log_fsync,
+                            args.rotate_size, args.rotate_every, args.log_compression)
+    hub.register(logger.sub)
+    flush_task = asyncio.create_task(logger.flush_periodically()) if logger.buffered else None
+    flush_on_signals(logger)
 
     if args.enable_api:
         if args.api_url:
-            api_server = APIServer();
-            pipeline.hub.register(api_server.sub)
+            store = SQLiteStore(args.history_db) if args.history_db else None
+            api_server = APIServer(history_size=args.history_size, history_age=args.history_age, store=store,
+                                   mode=args.api_mode, workers=args.api_workers)
+            hub.register(api_server.sub)
             await api_server.start(args.api_url)
         else:
             print("[API] Server could not initiate, url was not provided...")
@@ -65,8 +187,8 @@ async def main(args):
         port = args.tcp_port or SOCKET_PORT
         
         if host and port:
-            socket_server = SocketServer(host, port, args.verbose)
-            pipeline.hub.register(socket_server.sub)
+            socket_server = SocketServer(host, port, args.verbose, args.tcp_queue_size, args.tcp_overflow, args.tcp_framing)
+            hub.register(socket_server.sub)
             await socket_server.start()
         else:
             print("[Socket] Server could not initiate, host and port was not provided...")
@@ -76,12 +198,22 @@ async def main(args):
         port = args.ws_port or WEBSOCKET_PORT
         
         if host and port:
-            ws_server = WebSocketServer(host, port, args.verbose)
-            pipeline.hub.register(ws_server.sub)
+            ws_server = WebSocketServer(host, port, args.verbose, args.ws_coalesce, args.ws_compression == "deflate")
+            hub.register(ws_server.sub)
             await ws_server.start()
         else:
             print("[WS] Server could not initiate, host and port was not provided...")
 
+    if args.enable_multicast:
+        publisher = MulticastPublisher(args.mc_group or MULTICAST_GROUP, args.mc_port or MULTICAST_PORT, args.mc_ttl, args.mc_interface, args.verbose)
+        hub.register(publisher.sub)
+        await publisher.start()
+
+    if args.enable_shm:
+        shm_publisher = SharedMemoryPublisher(args.shm_name, args.shm_capacity, args.verbose)
+        hub.register(shm_publisher.sub)
+        await shm_publisher.start()
+
 
     while True:
         if state == AppState.SCAN:
@@ -161,14 +293,76 @@ async def main(args):
                     print("Invalid input, please try again.")
 
 
+        elif state == AppState.MONITOR:
+            await manager.start()
+            print(f"Monitoring {len(manager.pipelines)} devices...")
+
+            loop = asyncio.get_event_loop()
+            event = asyncio.Event()
+            def action_input():
+                while True:
+                    action = input(f"Receiving data... Enter [s] for device status or [q] to stop notification.\n").strip().lower()
+                    if action == "s":
+                        for address, status in manager.status().items():
+                            print(f"{address:17}  |  {status['state']:12}  |  {status['reconnects']} reconnects" + (f"  |  {status['error']}" if status['error'] else ""))
+                        for name, stats in hub.stats().items():
+                            print(f"{name:17}  |  {stats['depth']} queued  |  {stats['dropped']} dropped  |  {stats['lag_ms']} ms lag")
+                    elif action == "q":
+                        loop.call_soon_threadsafe(event.set)
+                        return
+            loop.run_in_executor(None, action_input)
+
+            await event.wait()
+            await manager.close()
+            state = AppState.QUIT
+
+
+        elif state == AppState.PASSIVE:
+            tasks = []
+            if args.interval:
+                tasks.append(asyncio.create_task(hub.send_interval()))
+            if hub.batcher:
+                tasks.append(asyncio.create_task(hub.send_batches()))
+
+            if args.adv_replay:
+                scanner.replay(args.adv_replay)
+                print(f"Replayed advertisements from {args.adv_replay}.")
+            else:
+                await scanner.start()
+                print("Listening for BLE advertisements... Enter [q] to stop.")
+
+                loop = asyncio.get_event_loop()
+                event = asyncio.Event()
+                def action_input():
+                    while input().strip().lower() != "q":
+                        pass
+                    loop.call_soon_threadsafe(event.set)
+                loop.run_in_executor(None, action_input)
+                await event.wait()
+
+            for task in tasks:
+                task.cancel()
+            await scanner.close()
+            hub.flush_batches()
+            state = AppState.QUIT
+
+
         elif state == AppState.QUIT:
+            if flush_task:
+                flush_task.cancel()
             logger.close()
             if args.enable_api and args.api_url:
                 await api_server.close()
+                if store:
+                    store.close()
             if args.enable_socket and (args.tcp_host or SOCKET_HOST) and (args.tcp_port or SOCKET_PORT):
                 await socket_server.close()
             if args.enable_websocket and (args.ws_host or WEBSOCKET_HOST) and (args.ws_port or WEBSOCKET_PORT):
                 await ws_server.close()
+            if args.enable_multicast:
+                await publisher.close()
+            if args.enable_shm:
+                await shm_publisher.close()
             print("Exiting program...")
             break
 
@@ -0,0 +1,113 @@
+import socket
+import struct
+import threading
+import os
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MULTICAST_GROUP = os.getenv("MULTICAST_GROUP", "239.255.42.99")
+MULTICAST_PORT = int(os.getenv("MULTICAST_PORT", '55556'))
+MULTICAST_INTERFACE = os.getenv("MULTICAST_INTERFACE", "0.0.0.0")
+
+# Datagram layout, mirrors core/wire.py on the server
+DATAGRAM_HEADER = struct.Struct("<BI6sB")   # version, sequence, device MAC address, record count
+DATAGRAM_VERSION = 1
+RECORD_LAYOUTS = {
+    1: ("XIAOMI", struct.Struct("<BdhBh"), ("timestamp", "temperature", "humidity", "battery"), (1, 100, 1, 1)),
+    2: ("O2RING", struct.Struct("<BdBH"), ("timestamp", "spo2", "pr"), (1, 1, 1)),
+}
+
+class MulticastClient:
+    def __init__(self, group, port, callback, interface: str = "0.0.0.0"):
+        self.group = group
+        self.port = port
+        self.callback = callback
+        self.interface = interface
+        self.sock = None
+        self.running = False
+        self.expected = None
+        self.received = 0
+        self.missed = 0
+        self.late = 0
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(("", self.port))
+        membership = socket.inet_aton(self.group) + socket.inet_aton(self.interface)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.running = True
+        print(f"[Multicast Client] Joined {self.group}:{self.port}.")
+        threading.Thread(target=self._recv_loop, daemon=True).start()
+
+    def _recv_loop(self):
+        while self.running:
+            try:
+                datagram = self.sock.recv(65535)
+            except OSError:
+                break
+            try:
+                self.handle_datagram(datagram)
+            except Exception as e:
+                print(f"Error occurred:", e)
+
+    def handle_datagram(self, datagram: bytes):
+        if len(datagram) < DATAGRAM_HEADER.size:
+            return
+        version, sequence, mac, count = DATAGRAM_HEADER.unpack_from(datagram)
+        if version != DATAGRAM_VERSION:
+            return
+
+        # Sequence numbers are 32-bit and wrap, a jump forward means datagrams were lost
+        if self.expected is not None and sequence != self.expected:
+            distance = (sequence - self.expected) & 0xFFFFFFFF
+            if distance < 0x80000000:
+                self.missed += distance
+                print(f"[Multicast Client] Gap detected, {distance} datagrams lost before {sequence}.")
+            else:
+                self.late += 1
+        if self.expected is None or (sequence - self.expected) & 0xFFFFFFFF < 0x80000000:
+            self.expected = (sequence + 1) & 0xFFFFFFFF
+        self.received += 1
+
+        address = ":".join(f"{byte:02X}" for byte in mac) if any(mac) else None
+        offset = DATAGRAM_HEADER.size
+        for _ in range(count):
+            source, layout, fields, scales = RECORD_LAYOUTS[datagram[offset]]
+            _source_id, *values = layout.unpack_from(datagram, offset)
+            offset += layout.size
+            self.callback({
+                "source": source,
+                "address": address,
+                "data": {field: value if scale == 1 else value / scale for field, value, scale in zip(fields, values, scales)},
+            })
+
+    def stats(self) -> dict:
+        return {"received": self.received, "missed": self.missed, "late": self.late}
+
+    def close(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+
+def handle_data(data: dict):
+    print("Data recieved:", data)
+
+async def main():
+    client = MulticastClient(MULTICAST_GROUP, MULTICAST_PORT, handle_data, MULTICAST_INTERFACE)
+    client.connect()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("[Multicast Client] Closing connection...")
@@ -0,0 +1,111 @@
+import os
+import time
+import struct
+import numpy as np
+from multiprocessing import shared_memory
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHM_NAME = os.getenv("SHM_NAME", "xiaomi_monitor")
+SHM_SOURCE = os.getenv("SHM_SOURCE", "XIAOMI")
+
+# Ring layout, mirrors services/shm_publisher.py on the server
+RING_MAGIC = b"XMRB"
+RING_VERSION = 1
+RING_HEADER = struct.Struct("<4sBBHI")
+COUNT_OFFSET = 16
+DATA_OFFSET = 64
+RING_LAYOUTS = {
+    "XIAOMI": (1, ("timestamp", "temperature", "humidity", "battery"), ("<f8", "<f8", "u1", "<i2")),
+    "O2RING": (2, ("timestamp", "spo2", "pr"), ("<f8", "u1", "<u2")),
+}
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    # Readers must never unlink the publisher's memory when they exit
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class RingReader:
+    def __init__(self, name: str, source: str, from_start: bool = False):
+        self.shm = attach(f"{name}_{source.lower()}")
+        magic, version, source_id, slot_size, capacity = RING_HEADER.unpack_from(self.shm.buf)
+        layout_id, fields, formats = RING_LAYOUTS[source]
+        if magic != RING_MAGIC or version != RING_VERSION or source_id != layout_id:
+            raise ValueError(f"{self.shm.name} is not a {source} ring")
+
+        offsets = [8]
+        for code in formats:
+            offsets.append(offsets[-1] + np.dtype(code).itemsize)
+        self.dtype = np.dtype({
+            "names": ["seq", *fields, "address"],
+            "formats": ["<u8", *formats, "S6"],
+            "offsets": [0, *offsets],
+            "itemsize": slot_size,
+        })
+        self.capacity = capacity
+        self.slots = np.ndarray((capacity,), self.dtype, buffer=self.shm.buf, offset=DATA_OFFSET)
+        self.head = np.ndarray((), "<u8", buffer=self.shm.buf, offset=COUNT_OFFSET)
+        self.position = 0 if from_start else int(self.head)
+        self.lost = 0
+        self.polled: list[tuple[np.ndarray, np.ndarray]] = []
+
+    def poll(self) -> list[np.ndarray]:
+        # Views of the slots written since the last poll, at most two when the range wraps around the ring.
+        # Nothing is copied, so the writer may overwrite them once it laps the reader, see `intact`.
+        head = int(self.head)
+        start = max(self.position, head - self.capacity)
+        self.lost += start - self.position
+        self.position = head
+        self.polled = []
+        while start < head:
+            index = start % self.capacity
+            length = min(head - start, self.capacity - index)
+            view = self.slots[index:index + length]
+            expected = 2 * np.arange(start, start + length, dtype=np.uint64) + 2
+            # Slots the writer already reused are dropped, they always form the front of the range
+            torn = int(np.count_nonzero(view["seq"] != expected))
+            if torn:
+                self.lost += torn
+                view, expected = view[torn:], expected[torn:]
+            if len(view):
+                self.polled.append((view, expected))
+            start += length
+        return [view for view, _expected in self.polled]
+
+    def intact(self) -> bool:
+        # Seqlock check: the views returned by the last poll still hold the records they held when polled
+        return all(np.array_equal(view["seq"], expected) for view, expected in self.polled)
+
+    def close(self):
+        self.polled = []
+        self.slots = None
+        self.head = None
+        self.shm.close()
+
+def main():
+    reader = RingReader(SHM_NAME, SHM_SOURCE)
+    print(f"[SHM Client] Reading {reader.shm.name}.")
+    field = RING_LAYOUTS[SHM_SOURCE][1][1]
+    try:
+        while True:
+            time.sleep(1.0)
+            views = reader.poll()
+            count = sum(len(view) for view in views)
+            if count:
+                mean = sum(float(view[field].sum()) for view in views) / count
+                if reader.intact():
+                    print(f"Data recieved: {count} readings, mean {field} {mean:.2f}, lost {reader.lost}")
+    finally:
+        reader.close()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("[SHM Client] Closing reader...")
@@ -1,4 +1,5 @@
 import socket
+import struct
 import threading
 import json
 import os
@@ -9,29 +10,80 @@ load_dotenv()
 
 SOCKET_HOST = os.getenv("SOCKET_HOST")
 SOCKET_PORT = int(os.getenv("SOCKET_PORT", '55555'))
+SOCKET_FRAMING = os.getenv("SOCKET_FRAMING", "json")
+
+# Binary framing, mirrors core/wire.py on the server
+FRAMING_COMMAND = b"FRAMING "
+FRAME_HEADER = struct.Struct("<H")
+RECORD_LAYOUTS = {
+    1: ("XIAOMI", struct.Struct("<BdhBh"), ("timestamp", "temperature", "humidity", "battery"), (1, 100, 1, 1)),
+    2: ("O2RING", struct.Struct("<BdBH"), ("timestamp", "spo2", "pr"), (1, 1, 1)),
+}
+
+def decode_record(record: bytes) -> dict:
+    # The packed record is followed by the 6-byte MAC address of the device (zeros when unknown)
+    source, layout, fields, scales = RECORD_LAYOUTS[record[0]]
+    _source_id, *values = layout.unpack_from(record)
+    address = record[layout.size:layout.size + 6]
+    return {
+        "source": source,
+        "address": ":".join(f"{byte:02X}" for byte in address) if any(address) else None,
+        "data": {field: value if scale == 1 else value / scale for field, value, scale in zip(fields, values, scales)},
+    }
 
 class SocketClient:
-    def __init__(self, host, port, callback):
+    def __init__(self, host, port, callback, framing: str = "json"):
         self.host = host
         self.port = port
         self.sock = None
         self.callback = callback
+        self.framing = framing
         self.running = False
 
     def connect(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((self.host, self.port))
         self.running = True
+        self.sock.sendall(FRAMING_COMMAND + self.framing.encode() + b"\n")
         print(f"[TCP Client] Connected to {self.host}:{self.port}.")
         threading.Thread(target=self._recv_loop, daemon=True).start()
 
     def _recv_loop(self):
+        buffer = b""
+        # Anything sent before the server acknowledges the requested framing is discarded
+        ack = FRAMING_COMMAND + self.framing.encode() + b"\n"
+        negotiated = False
         while self.running:
             try:
-                data = self.sock.recv(1024)
+                data = self.sock.recv(4096)
                 if not data:
                     break
-                self.callback(data)
+                buffer += data
+                if not negotiated:
+                    index = buffer.find(ack)
+                    if index < 0:
+                        buffer = buffer[-len(ack):]
+                        continue
+                    buffer = buffer[index + len(ack):]
+                    negotiated = True
+
+                offset = 0
+                if self.framing == "json":
+                    end = buffer.find(b"\n", offset)
+                    while end >= 0:
+                        if end > offset:
+                            self.callback(json.loads(buffer[offset:end]))
+                        offset = end + 1
+                        end = buffer.find(b"\n", offset)
+                else:
+                    while len(buffer) - offset >= FRAME_HEADER.size:
+                        (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+                        end = offset + FRAME_HEADER.size + length
+                        if len(buffer) < end:
+                            break
+                        self.callback(decode_record(buffer[offset + FRAME_HEADER.size:end]))
+                        offset = end
+                buffer = buffer[offset:]
             except Exception as e:
                 print(f"Error occurred:", e)
 
@@ -41,10 +93,10 @@ class SocketClient:
             self.sock.close()
 
 def handle_data(data: dict):
-    print("Data recieved:", json.loads(data.decode('utf-8')))
+    print("Data recieved:", data)
 
 async def main():
-    client = SocketClient(SOCKET_HOST, SOCKET_PORT, handle_data)
+    client = SocketClient(SOCKET_HOST, SOCKET_PORT, handle_data, SOCKET_FRAMING)
     client.connect()
 
     try:
@@ -56,4 +108,4 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("[TCP Client] Closing connection...")
\ No newline at end of file
+        print("[TCP Client] Closing connection...")
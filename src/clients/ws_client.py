@@ -1,5 +1,6 @@
 import websockets
 import asyncio
+import json
 import os
 from dotenv import load_dotenv
 
@@ -7,11 +8,14 @@ load_dotenv()
 
 WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST")
 WEBSOCKET_PORT = int(os.getenv("WEBSOCKET_PORT", '80'))
+# Optional subscribe message, e.g. {"type": "subscribe", "sources": ["XIAOMI"], "max_rate": 2}
+WEBSOCKET_SUBSCRIBE = os.getenv("WEBSOCKET_SUBSCRIBE")
 
 class WebSocketClient:
-    def __init__(self, host, port, callback):
+    def __init__(self, host, port, callback, subscribe: dict | None = None):
         self.uri = f"ws://{host}:{port}"
         self.callback = callback
+        self.subscribe = subscribe
         self.websocket = None
         self.running = False
 
@@ -20,10 +24,17 @@ class WebSocketClient:
             self.websocket = ws
             self.running = True
             print(f"[WS Client] Connected to {self.uri}.")
+            if self.subscribe:
+                await ws.send(json.dumps(self.subscribe))
 
             try:
                 async for msg in ws:
-                    self.callback(msg)
+                    # Coalesced frames hold a JSON array of readings, subscribe replies are text frames
+                    if isinstance(msg, bytes) and msg.startswith(b"["):
+                        for reading in json.loads(msg):
+                            self.callback(json.dumps(reading).encode('utf-8'))
+                    else:
+                        self.callback(msg)
             except websockets.ConnectionClosed:
                 print(f"[WS Client] Connection closed.")
 
@@ -35,11 +46,12 @@ class WebSocketClient:
             await self.websocket.close()
         self.running = False
 
-def handle_data(msg: dict):
-    print("Data recieved:", msg.decode('utf-8'))
+def handle_data(msg: bytes | str):
+    print("Data recieved:", msg.decode('utf-8') if isinstance(msg, bytes) else msg)
 
 async def main():
-    client = WebSocketClient(WEBSOCKET_HOST, WEBSOCKET_PORT, handle_data)
+    subscribe = json.loads(WEBSOCKET_SUBSCRIBE) if WEBSOCKET_SUBSCRIBE else None
+    client = WebSocketClient(WEBSOCKET_HOST, WEBSOCKET_PORT, handle_data, subscribe)
     client.start()
 
     try:
@@ -1,7 +1,15 @@
 # core/__init__.py
 
-from .models import Measurement, MiData, O2Data
+from .encoding import get_json_encoder, set_json_encoder
+from .models import Measurement, MiData, O2Data, Reading, MiRecord, O2Record
+from .batching import MeasurementBatch, MeasurementBatcher
+from .history import HistoryBuffer
+from .store import SQLiteStore
+from . import metrics
 from .notification_hub import NotificationHub
 from .pipeline import SensorPipeline, SensorPipelineError
+from .manager import PipelineManager, DeviceState
+from .advertisement import AdvertisementScanner
+from .simulator import SimulatedBackend
 
-__all__ = ["Measurement", "MiData", "O2Data", "NotificationHub", "SensorPipeline", "SensorPipelineError"]
\ No newline at end of file
+__all__ = ["get_json_encoder", "set_json_encoder", "Measurement", "MiData", "O2Data", "Reading", "MiRecord", "O2Record", "MeasurementBatch", "MeasurementBatcher", "HistoryBuffer", "SQLiteStore", "metrics", "NotificationHub", "SensorPipeline", "SensorPipelineError", "PipelineManager", "DeviceState", "AdvertisementScanner", "SimulatedBackend"]
\ No newline at end of file
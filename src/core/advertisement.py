@@ -0,0 +1,129 @@
+import json
+import time
+import struct
+from bleak import BleakScanner
+from core import NotificationHub, Reading, MiRecord, metrics
+
+# Service data UUIDs carrying LYWSD03MMC readings in BLE advertisements
+ENV_SENSING_UUID = "0000181a-0000-1000-8000-00805f9b34fb"   # ATC1441 / PVVX custom firmware
+MIBEACON_UUID = "0000fe95-0000-1000-8000-00805f9b34fb"      # Stock Xiaomi firmware
+
+ATC_LAYOUT = struct.Struct(">6shBBHB")     # mac, temperature (0.1C), humidity (%), battery (%), battery (mV), counter
+PVVX_LAYOUT = struct.Struct("<6shHHBBB")   # mac, temperature (0.01C), humidity (0.01%), battery (mV), battery (%), counter, flags
+
+MIBEACON_ENCRYPTED = 0x0008
+MIBEACON_HAS_MAC = 0x0010
+MIBEACON_HAS_CAPABILITY = 0x0020
+MIBEACON_HAS_OBJECT = 0x0040
+
+def decode_atc(payload: bytes) -> dict | None:
+    if len(payload) == ATC_LAYOUT.size:
+        _mac, temp, humid, battery, _volt, counter = ATC_LAYOUT.unpack(payload)
+        return {"temperature": temp / 10, "humidity": humid, "battery": battery, "counter": counter}
+    if len(payload) == PVVX_LAYOUT.size:
+        _mac, temp, humid, _volt, battery, counter, _flags = PVVX_LAYOUT.unpack(payload)
+        return {"temperature": temp / 100, "humidity": round(humid / 100), "battery": battery, "counter": counter}
+    return None
+
+def decode_mibeacon(payload: bytes) -> dict | None:
+    # Decoding logic follows the MiBeacon object format documented by the custom firmware projects
+    if len(payload) < 5:
+        return None
+    frame_control = int.from_bytes(payload[0:2], "little")
+    if frame_control & MIBEACON_ENCRYPTED or not frame_control & MIBEACON_HAS_OBJECT:
+        return None
+
+    decoded = {"counter": payload[4]}
+    offset = 5
+    if frame_control & MIBEACON_HAS_MAC:
+        offset += 6
+    if frame_control & MIBEACON_HAS_CAPABILITY:
+        offset += 1
+
+    while offset + 3 <= len(payload):
+        object_type = int.from_bytes(payload[offset:offset + 2], "little")
+        length = payload[offset + 2]
+        value = payload[offset + 3:offset + 3 + length]
+        offset += 3 + length
+        if len(value) < length:
+            break
+
+        if object_type == 0x1004 and length == 2:
+            decoded["temperature"] = int.from_bytes(value, "little", signed=True) / 10
+        elif object_type == 0x1006 and length == 2:
+            decoded["humidity"] = round(int.from_bytes(value, "little") / 10)
+        elif object_type == 0x100A and length >= 1:
+            decoded["battery"] = value[0]
+        elif object_type == 0x100D and length == 4:
+            decoded["temperature"] = int.from_bytes(value[0:2], "little", signed=True) / 10
+            decoded["humidity"] = round(int.from_bytes(value[2:4], "little") / 10)
+    return decoded
+
+DECODERS = {
+    ENV_SENSING_UUID: decode_atc,
+    MIBEACON_UUID: decode_mibeacon,
+}
+
+class AdvertisementScanner:
+    def __init__(self, hub: NotificationHub, addresses: list[str] | None = None, record: str | None = None,
+                 scanning_mode: str = "active"):
+        self.hub = hub
+        self.addresses = {address.upper() for address in addresses} if addresses else None
+        self.scanning_mode = scanning_mode
+        self.scanner: BleakScanner | None = None
+        # Stock firmware sends one field per advertisement, so the latest values are merged per device
+        self.state: dict[str, dict] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+        self.record_file = open(record, "a") if record else None
+
+    async def start(self):
+        self.scanner = BleakScanner(detection_callback=self.detection_callback, scanning_mode=self.scanning_mode)
+        await self.scanner.start()
+        return self
+
+    def detection_callback(self, device, advertisement_data):
+        for uuid, payload in advertisement_data.service_data.items():
+            if uuid in DECODERS:
+                self.feed(device.address, uuid, payload)
+
+    def feed(self, address: str, uuid: str, payload: bytes, timestamp: float | None = None):
+        address = address.upper()
+        if self.addresses is not None and address not in self.addresses:
+            return
+        decoded = DECODERS[uuid](bytes(payload))
+        if not decoded:
+            return
+        # Advertisements bypass NotificationHub.handle_notify, so they are counted here
+        if metrics.ENABLED:
+            metrics.PACKETS_RECEIVED.inc(address)
+
+        # Sensors repeat each advertisement several times, only new frame counters are published
+        counter = decoded.pop("counter")
+        if self.counters.get((address, uuid)) == counter:
+            return
+        self.counters[(address, uuid)] = counter
+
+        if self.record_file:
+            self.record_file.write(json.dumps({"address": address, "uuid": uuid, "data": bytes(payload).hex(), "timestamp": time.time()}) + "\n")
+
+        state = self.state.setdefault(address, {})
+        state.update(decoded)
+        if len(state) == len(MiRecord.FIELDS) - 1:
+            record = MiRecord(timestamp or time.time(), state["temperature"], state["humidity"], state["battery"])
+            self.hub.publish(Reading("XIAOMI", record, address))
+
+    def replay(self, path: str):
+        # Feed advertisements recorded with `record`, one JSON object per line
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.feed(entry["address"], entry["uuid"], bytes.fromhex(entry["data"]), entry.get("timestamp"))
+
+    async def close(self):
+        if self.scanner:
+            await self.scanner.stop()
+            self.scanner = None
+        if self.record_file:
+            self.record_file.close()
+            self.record_file = None
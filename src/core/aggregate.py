@@ -0,0 +1,80 @@
+import numpy as np
+
+AGGREGATES = ("min", "max", "mean", "last", "lttb")
+MAX_BUCKETS = 10000
+
+def bucket_layout(first: float, last: float, width: float | None = None, buckets: int | None = None) -> tuple[float, float, int]:
+    # Width, origin and number of the buckets covering [first, last], from either a width or a bucket count
+    span = float(last - first)
+    if buckets is not None:
+        # Anchor on the first sample so the range splits into exactly `buckets` buckets
+        return span / buckets * (1 + 1e-9) or 1.0, float(first), buckets
+    if span // width + 1 > MAX_BUCKETS:
+        raise ValueError(f"'width' too small, the range would exceed {MAX_BUCKETS} buckets.")
+    return width, float(np.floor(first / width) * width), int(span // width) + 1
+
+def summarize(timestamps: np.ndarray, values: dict[str, np.ndarray], funcs: list[str], width: float | None = None,
+              buckets: int | None = None) -> dict:
+    origin = None
+    if len(timestamps):
+        width, origin, buckets = bucket_layout(timestamps[0], timestamps[-1], width, buckets)
+    result = {"width": width, **bucketize(timestamps, values, width, funcs, origin)}
+    if "lttb" in funcs:
+        for field, column in values.items():
+            selected = lttb(timestamps, column, buckets or 0)
+            result[field]["lttb"] = {"timestamp": timestamps[selected].tolist(), "value": column[selected].tolist()}
+    return result
+
+def bucketize(timestamps: np.ndarray, values: dict[str, np.ndarray], width: float, funcs: list[str],
+              origin: float | None = None) -> dict:
+    # Timestamps are sorted, so bucket ids are non-decreasing and each bucket is one contiguous run
+    if not len(timestamps):
+        return {"timestamp": [], "count": [], **{field: {func: [] for func in funcs} for field in values}}
+
+    if origin is None:
+        origin = np.floor(timestamps[0] / width) * width
+    ids = np.floor((timestamps - origin) / width).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    ends = np.append(starts[1:], len(ids))
+    counts = ends - starts
+
+    result = {
+        "timestamp": (origin + ids[starts] * width).tolist(),
+        "count": counts.tolist(),
+    }
+    for field, column in values.items():
+        stats = {}
+        if "min" in funcs:
+            stats["min"] = np.minimum.reduceat(column, starts).tolist()
+        if "max" in funcs:
+            stats["max"] = np.maximum.reduceat(column, starts).tolist()
+        if "mean" in funcs:
+            stats["mean"] = (np.add.reduceat(column, starts) / counts).tolist()
+        if "last" in funcs:
+            stats["last"] = column[ends - 1].tolist()
+        result[field] = stats
+    return result
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets downsampling, returns the indices of the selected points
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean() if next_hi > next_lo else x[-1]
+        avg_y = y[next_lo:next_hi].mean() if next_hi > next_lo else y[-1]
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[lo:hi] - y[previous]) - (x[previous] - x[lo:hi]) * (avg_y - y[previous])
+        )
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
@@ -0,0 +1,61 @@
+import time
+from array import array
+from core.models import Reading, RECORDS
+
+class MeasurementBatch:
+    __slots__ = ("source", "address", "record", "columns", "_arrays")
+
+    def __init__(self, source: str, address: str | None = None):
+        self.source = source
+        self.address = address
+        self.record = RECORDS[source]
+        self.columns = {field: array(code) for field, code in zip(self.record.FIELDS, self.record.TYPECODES)}
+        self._arrays = tuple(self.columns.values())
+
+    def __len__(self):
+        return len(self._arrays[0])
+
+    def append(self, reading: Reading):
+        for column, value in zip(self._arrays, reading.data.astuple()):
+            column.append(value)
+
+    def rows(self):
+        return zip(*self._arrays)
+
+    def readings(self):
+        for row in self.rows():
+            yield Reading(self.source, self.record(*row), self.address)
+
+    def last(self) -> Reading | None:
+        if not len(self):
+            return None
+        return Reading(self.source, self.record(*(column[-1] for column in self._arrays)), self.address)
+
+class MeasurementBatcher:
+    def __init__(self, size: int = 256, max_age: float = 1.0):
+        self.size = size
+        self.max_age = max_age
+        self.batches: dict[tuple[str, str | None], MeasurementBatch] = {}
+        self.started: float | None = None
+
+    def add(self, reading: Reading) -> list[MeasurementBatch]:
+        key = (reading.source, reading.address)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = MeasurementBatch(reading.source, reading.address)
+        batch.append(reading)
+
+        if self.started is None:
+            self.started = time.monotonic()
+        if len(batch) >= self.size or self.due():
+            return self.drain()
+        return []
+
+    def due(self) -> bool:
+        return self.started is not None and time.monotonic() - self.started >= self.max_age
+
+    def drain(self) -> list[MeasurementBatch]:
+        batches = [batch for batch in self.batches.values() if len(batch)]
+        self.batches = {}
+        self.started = None
+        return batches
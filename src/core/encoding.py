@@ -0,0 +1,44 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Encoders turn a reading into the bytes sent over the wire. Each reading caches
+# its payload per encoder name, so it is encoded once no matter how many transports send it.
+
+class Encoder:
+    name: str = ""
+
+    def encode(self, reading) -> bytes:
+        raise NotImplementedError
+
+class JSONEncoder(Encoder):
+    name = "json"
+
+    def encode(self, reading) -> bytes:
+        return json.dumps(reading.model_dump()).encode('utf-8')
+
+class OrjsonEncoder(Encoder):
+    name = "orjson"
+
+    def encode(self, reading) -> bytes:
+        return orjson.dumps(reading.model_dump())
+
+ENCODERS: dict[str, type[Encoder]] = {"json": JSONEncoder}
+if orjson is not None:
+    ENCODERS["orjson"] = OrjsonEncoder
+
+_json_encoder: Encoder = ENCODERS["orjson" if orjson is not None else "json"]()
+
+def get_json_encoder() -> Encoder:
+    return _json_encoder
+
+def set_json_encoder(encoder: str | Encoder):
+    global _json_encoder
+    if isinstance(encoder, str):
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown JSON encoder '{encoder}', available: {list(ENCODERS)}")
+        encoder = ENCODERS[encoder]()
+    _json_encoder = encoder
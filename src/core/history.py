@@ -0,0 +1,194 @@
+import numpy as np
+from typing import Iterable
+from core.models import Reading, RECORDS
+from core.aggregate import summarize
+
+SOURCES = tuple(RECORDS)
+VALUE_FIELDS = tuple(dict.fromkeys(field for record in RECORDS.values() for field in record.FIELDS[1:]))
+# Readings up to this many seconds older than the newest one are inserted in order (batches from several
+# devices arrive one device at a time), anything older means the wall clock stepped backwards
+REORDER_WINDOW = 60.0
+
+class HistoryBuffer:
+    def __init__(self, capacity: int = 86400, max_age: float | None = None):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1.")
+        self.capacity = capacity
+        self.max_age = max_age
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        # Object array, so inserting out-of-order readings moves the newer ones with one slice copy
+        self.items = np.full(capacity, None, dtype=object)
+        # Numeric columns mirroring the items, used for vectorized aggregation
+        self.sources = np.zeros(capacity, dtype=np.int8)
+        self.values = np.full((capacity, len(VALUE_FIELDS)), np.nan)
+        self._value_index = {
+            source: [VALUE_FIELDS.index(field) for field in record.FIELDS[1:]] for source, record in RECORDS.items()
+        }
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self._slice(0, self.count)
+
+    def append(self, reading: Reading):
+        ts = reading.data.timestamp
+        if self.count:
+            newest = self.timestamps[(self.start + self.count - 1) % self.capacity]
+            if ts < newest:
+                if newest - ts <= REORDER_WINDOW:
+                    self._merge([reading])
+                    return
+                # Keep the timestamp column sorted when the wall clock steps backwards
+                ts = newest
+
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.timestamps[index] = ts
+        self.items[index] = reading
+        self.sources[index] = SOURCES.index(reading.source)
+        self.values[index, self._value_index[reading.source]] = reading.data.astuple()[1:]
+
+        if self.max_age:
+            self._expire(ts - self.max_age)
+
+    def extend(self, readings: Iterable[Reading]):
+        readings = list(readings)
+        if not readings:
+            return
+        first = readings[0].data.timestamp
+        in_order = all(a.data.timestamp <= b.data.timestamp for a, b in zip(readings, readings[1:]))
+        if in_order and (not self.count or first >= self.timestamps[(self.start + self.count - 1) % self.capacity]):
+            for reading in readings:
+                self.append(reading)
+        else:
+            # Batches from several devices arrive one device at a time, each is merged in one pass
+            self._merge(readings)
+
+    def _merge(self, readings: list[Reading]):
+        count = len(readings)
+        timestamps = np.fromiter((reading.data.timestamp for reading in readings), dtype=np.float64, count=count)
+        sources = np.fromiter((SOURCES.index(reading.source) for reading in readings), dtype=np.int8, count=count)
+        values = np.full((count, len(VALUE_FIELDS)), np.nan)
+        for row, reading in zip(values, readings):
+            row[self._value_index[reading.source]] = reading.data.astuple()[1:]
+        items = np.empty(count, dtype=object)
+        items[:] = readings
+
+        newest = self.timestamps[(self.start + self.count - 1) % self.capacity] if self.count else -np.inf
+        # Readings beyond the reorder window mean the wall clock stepped backwards, they are stamped as the newest
+        timestamps[timestamps < newest - REORDER_WINDOW] = newest
+        position = self._search(float(timestamps.min()), "right") if self.count else 0
+
+        # The readings newer than the insertion point are merged with the new ones and written back in one block
+        tail = (self.start + np.arange(position, self.count)) % self.capacity
+        timestamps = np.concatenate((self.timestamps[tail], timestamps))
+        order = np.argsort(timestamps, kind="stable")
+        merged = (
+            timestamps[order],
+            np.concatenate((self.sources[tail], sources))[order],
+            np.concatenate((self.values[tail], values))[order],
+            np.concatenate((self.items[tail], items))[order],
+        )
+        self.count = position
+        self._write(*merged)
+
+        if self.max_age:
+            self._expire(float(merged[0][-1]) - self.max_age)
+
+    def _write(self, timestamps: np.ndarray, sources: np.ndarray, values: np.ndarray, items: np.ndarray):
+        # Appends sorted readings after the current end, dropping the oldest ones when the buffer is full
+        if len(timestamps) > self.capacity:
+            timestamps, sources, values, items = (column[-self.capacity:] for column in (timestamps, sources, values, items))
+        count = len(timestamps)
+        indices = (self.start + self.count + np.arange(count)) % self.capacity
+        self.timestamps[indices] = timestamps
+        self.sources[indices] = sources
+        self.values[indices] = values
+        self.items[indices] = items
+        overflow = max(0, self.count + count - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.count += count - overflow
+
+    def clear(self):
+        self.items = np.full(self.capacity, None, dtype=object)
+        self.start = 0
+        self.count = 0
+
+    def query(self, since: float | None = None, until: float | None = None, limit: int | None = None,
+              device: str | None = None) -> list[Reading]:
+        lo, hi = self.bounds(since, until)
+        if device is not None:
+            readings = [reading for reading in self._slice(lo, hi) if reading.address == device]
+            if limit is not None and len(readings) > limit:
+                readings = readings[:limit] if since is not None else readings[-limit:]
+            return readings
+        if limit is not None and hi - lo > limit:
+            # Paginate forward from `since`, otherwise return the most recent samples
+            if since is not None:
+                hi = lo + limit
+            else:
+                lo = hi - limit
+        return list(self._slice(lo, hi))
+
+    def columns(self, source: str, fields: Iterable[str], since: float | None = None, until: float | None = None,
+                device: str | None = None):
+        lo, hi = self.bounds(since, until)
+        parts = self.segments(lo, hi)
+        if not parts:
+            return np.empty(0), {field: np.empty(0) for field in fields}
+
+        mask = np.concatenate([self.sources[part] for part in parts]) == SOURCES.index(source)
+        if device is not None:
+            mask &= np.fromiter((reading.address == device for reading in self._slice(lo, hi)), dtype=bool, count=hi - lo)
+        timestamps = np.concatenate([self.timestamps[part] for part in parts])[mask]
+        values = np.concatenate([self.values[part] for part in parts])[mask]
+        return timestamps, {field: values[:, VALUE_FIELDS.index(field)] for field in fields}
+
+    def aggregate(self, source: str, fields: Iterable[str], funcs: list[str], width: float | None = None, buckets: int | None = None,
+                  since: float | None = None, until: float | None = None, device: str | None = None) -> dict:
+        timestamps, values = self.columns(source, fields, since, until, device)
+        return summarize(timestamps, values, funcs, width, buckets)
+
+    def bounds(self, since: float | None = None, until: float | None = None) -> tuple[int, int]:
+        lo = self._search(since, "left") if since is not None else 0
+        hi = self._search(until, "right") if until is not None else self.count
+        return lo, max(lo, hi)
+
+    def segments(self, lo: int = 0, hi: int | None = None) -> list[slice]:
+        # Physical slices covering logical positions [lo, hi) of the ring
+        hi = self.count if hi is None else hi
+        if lo >= hi:
+            return []
+        first, last = self.start + lo, self.start + hi
+        if last <= self.capacity:
+            return [slice(first, last)]
+        if first >= self.capacity:
+            return [slice(first - self.capacity, last - self.capacity)]
+        return [slice(first, self.capacity), slice(0, last - self.capacity)]
+
+    def _search(self, ts: float, side: str) -> int:
+        offset = 0
+        for part in self.segments():
+            column = self.timestamps[part]
+            index = int(np.searchsorted(column, ts, side))
+            if index < len(column):
+                return offset + index
+            offset += len(column)
+        return offset
+
+    def _slice(self, lo: int, hi: int):
+        for part in self.segments(lo, hi):
+            yield from self.items[part]
+
+    def _expire(self, cutoff: float):
+        expired = self._search(cutoff, "left")
+        for part in self.segments(0, expired):
+            self.items[part] = [None] * (part.stop - part.start)
+        self.start = (self.start + expired) % self.capacity
+        self.count -= expired
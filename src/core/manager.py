@@ -0,0 +1,99 @@
+import asyncio
+from enum import Enum, auto
+from core import NotificationHub, SensorPipeline
+
+class DeviceState(Enum):
+    PENDING = auto()
+    CONNECTING = auto()
+    CONNECTED = auto()
+    RETRYING = auto()
+    RECONNECTING = auto()
+    STOPPED = auto()
+
+def load_addresses(path: str) -> list[str]:
+    # One MAC address per line, blank lines and '#' comments are ignored
+    addresses = []
+    with open(path) as file:
+        for line in file:
+            address = line.split("#", 1)[0].strip()
+            if address:
+                addresses.append(address)
+    return addresses
+
+class PipelineManager:
+    def __init__(self, addresses: list[str], interval: int | None = None, verbose: bool = False,
+                 retry_delay: float = 5.0, max_connecting: int = 1, watchdog: float | None = None, backend=None):
+        self.hub = NotificationHub(interval, verbose)
+        self.interval = interval
+        self.verbose = verbose
+        self.retry_delay = retry_delay
+        # BLE adapters generally handle one connection attempt at a time
+        self._connect_slots = asyncio.Semaphore(max_connecting)
+
+        addresses = list(dict.fromkeys(addresses))
+        self.pipelines: dict[str, SensorPipeline] = {
+            address: SensorPipeline(verbose=verbose, hub=self.hub, reconnect=True, watchdog=watchdog, backend=backend) for address in addresses
+        }
+        self.states: dict[str, DeviceState] = {address: DeviceState.PENDING for address in addresses}
+        self.errors: dict[str, str] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.send_task = None
+        self.batch_task = None
+
+    async def start(self):
+        for address, pipeline in self.pipelines.items():
+            self.tasks[address] = asyncio.create_task(self._supervise(address, pipeline))
+        if self.interval:
+            self.send_task = asyncio.create_task(self.hub.send_interval())
+        if self.hub.batcher:
+            self.batch_task = asyncio.create_task(self.hub.send_batches())
+        return self
+
+    async def _supervise(self, address: str, pipeline: SensorPipeline):
+        while True:
+            async with self._connect_slots:
+                self.states[address] = DeviceState.CONNECTING
+                try:
+                    await pipeline.connect(address)
+                    self.states[address] = DeviceState.CONNECTED
+                    self.errors.pop(address, None)
+                    if self.verbose:
+                        print(f"[Manager] Connected to {address}.")
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.states[address] = DeviceState.RETRYING
+                    self.errors[address] = str(e) or type(e).__name__
+                    if self.verbose:
+                        print(f"[Manager] Connection to {address} failed: {self.errors[address]}")
+            await asyncio.sleep(self.retry_delay)
+
+    def state(self, address: str) -> DeviceState:
+        if self.states[address] == DeviceState.CONNECTED and self.pipelines[address].reconnecting:
+            return DeviceState.RECONNECTING
+        return self.states[address]
+
+    def status(self) -> dict[str, dict]:
+        return {
+            address: {
+                "state": self.state(address).name,
+                "error": self.errors.get(address),
+                "reconnects": self.pipelines[address].reconnects,
+            }
+            for address in self.pipelines
+        }
+
+    async def close(self):
+        for task in (*self.tasks.values(), self.send_task, self.batch_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+        results = await asyncio.gather(*(pipeline.close() for pipeline in self.pipelines.values()), return_exceptions=True)
+        for address, result in zip(self.pipelines, results):
+            self.states[address] = DeviceState.STOPPED
+            if isinstance(result, Exception) and self.verbose:
+                print(f"[Manager] Error while disconnecting {address}: {result}")
+        self.hub.flush_batches()
+        await self.hub.close()
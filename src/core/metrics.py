@@ -0,0 +1,133 @@
+import bisect
+import threading
+
+# Hot paths check `metrics.ENABLED` before timing anything, so disabled metrics cost one attribute lookup.
+ENABLED = False
+
+def enable(enabled: bool = True):
+    global ENABLED
+    ENABLED = enabled
+
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}", *self.samples()])
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}" for labels, value in list(self.values.items())]
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+        self.callbacks: dict[tuple, callable] = {}
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def track(self, callback, *labels):
+        # Evaluated at scrape time only, for values such as queue depths that already exist elsewhere
+        self.callbacks[labels] = callback
+
+    def untrack(self, *labels):
+        self.callbacks.pop(labels, None)
+        self.values.pop(labels, None)
+
+    def samples(self) -> list[str]:
+        values = dict(self.values)
+        for labels, callback in list(self.callbacks.items()):
+            try:
+                values[labels] = callback()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}" for labels, value in values.items()]
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), list(counts)):
+                cumulative += count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+PACKETS_RECEIVED = REGISTRY.register(Counter("monitor_packets_received_total", "BLE packets decoded per device.", ("device",)))
+DECODE_SECONDS = REGISTRY.register(Histogram("monitor_decode_seconds", "Time spent decoding a packet in NotificationHub.handle_notify."))
+SUBSCRIBER_SECONDS = REGISTRY.register(Histogram("monitor_subscriber_seconds", "Time spent in each subscriber called by NotificationHub.", ("subscriber",)))
+SEND_SECONDS = REGISTRY.register(Histogram("monitor_send_seconds", "Time to send one message to one client.", ("transport",)))
+QUEUE_DEPTH = REGISTRY.register(Gauge("monitor_queue_depth", "Messages waiting in outbound queues.", ("transport",)))
+QUEUE_DROPPED = REGISTRY.register(Gauge("monitor_queue_dropped", "Messages dropped by full outbound queues.", ("transport",)))
+SUBSCRIBER_LAG = REGISTRY.register(Gauge("monitor_subscriber_lag_seconds", "Time the last reading waited in a coroutine subscriber's queue.", ("subscriber",)))
+CLIENTS_DROPPED = REGISTRY.register(Counter("monitor_clients_dropped_total", "Clients disconnected because of send errors or overflow.", ("transport",)))
+RECONNECTS = REGISTRY.register(Counter("monitor_reconnects_total", "BLE reconnections per device.", ("device",)))
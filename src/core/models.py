@@ -1,8 +1,12 @@
+from copy import copy
+from operator import attrgetter
 from pydantic import BaseModel
 from typing import Union
+from core.encoding import Encoder, get_json_encoder
 
 class Measurement(BaseModel):
     source: str
+    address: str | None = None
     data: Union["MiData", "O2Data"]
 
 class MiData(BaseModel):
@@ -16,4 +20,88 @@ class O2Data(BaseModel):
     spo2: int
     pr: int
 
-Measurement.model_rebuild()
\ No newline at end of file
+Measurement.model_rebuild()
+
+# Lightweight records built on the notification hot path.
+# The pydantic models above only document the API schema, responses are served from cached JSON payloads.
+
+class Record:
+    __slots__ = ()
+    FIELDS: tuple[str, ...] = ()
+    TYPECODES: tuple[str, ...] = ()
+    MODEL: type[BaseModel] = None
+
+    def __init_subclass__(cls):
+        cls.FIELDS = cls.__slots__
+        cls._getter = attrgetter(*cls.FIELDS)
+
+    def __iter__(self):
+        return zip(self.FIELDS, self._getter(self))
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={value!r}" for field, value in self)
+        return f"{self.MODEL.__name__}({values})"
+
+    def astuple(self) -> tuple:
+        return self._getter(self)
+
+    def model_dump(self) -> dict:
+        return dict(zip(self.FIELDS, self._getter(self)))
+
+class MiRecord(Record):
+    __slots__ = ("timestamp", "temperature", "humidity", "battery")
+    TYPECODES = ("d", "d", "B", "h")
+    MODEL = MiData
+
+    def __init__(self, timestamp: float, temperature: float, humidity: int, battery: int):
+        self.timestamp = timestamp
+        self.temperature = temperature
+        self.humidity = humidity
+        self.battery = battery
+
+class O2Record(Record):
+    __slots__ = ("timestamp", "spo2", "pr")
+    TYPECODES = ("d", "B", "H")
+    MODEL = O2Data
+
+    def __init__(self, timestamp: float, spo2: int, pr: int):
+        self.timestamp = timestamp
+        self.spo2 = spo2
+        self.pr = pr
+
+class Reading:
+    __slots__ = ("source", "data", "address", "_encoded")
+
+    def __init__(self, source: str, data: Record, address: str | None = None):
+        self.source = source
+        self.data = data
+        self.address = address
+        self._encoded: dict[str, bytes] | None = None
+
+    def __repr__(self):
+        return f"source={self.source!r} address={self.address!r} data={self.data!r}"
+
+    def stamped(self, timestamp: float) -> "Reading":
+        data = copy(self.data)
+        data.timestamp = timestamp
+        return Reading(self.source, data, self.address)
+
+    def model_dump(self) -> dict:
+        return {"source": self.source, "address": self.address, "data": self.data.model_dump()}
+
+    def encode(self, encoder: Encoder) -> bytes:
+        # Readings are immutable once published, so each encoding is built at most once
+        if self._encoded is None:
+            self._encoded = {}
+        payload = self._encoded.get(encoder.name)
+        if payload is None:
+            payload = self._encoded[encoder.name] = encoder.encode(self)
+        return payload
+
+    def payload(self) -> bytes:
+        return self.encode(get_json_encoder())
+
+RECORDS: dict[str, type[Record]] = {
+    "XIAOMI": MiRecord,
+    "O2RING": O2Record,
+}
@@ -1,105 +1,266 @@
-import sys
 import os
 import time
+import struct
 import asyncio
 import inspect
 from bleak.backends.characteristic import BleakGATTCharacteristic
 from dotenv import load_dotenv
-from core import Measurement, MiData, O2Data
+from core import Reading, MiRecord, O2Record, MeasurementBatch, MeasurementBatcher, metrics
+from core.models import RECORDS
+from core.queues import BoundedQueue, DROP_OLDEST, OVERFLOW_POLICIES
 
 load_dotenv()
 
 MI_NOTIFY_CHAR = os.getenv('MI_CHARACTERISTIC', 0)
 O2_NOTIFY_CHAR = os.getenv('O2_NOTIFY_CHAR', 0)
+# Characteristics of simulated devices (core.simulator), independent of the .env configuration
+SIM_MI_CHAR = "sim-mi-notify"
+SIM_O2_CHAR = "sim-o2-notify"
+
+# Precompiled packet layouts (BLE payloads are little-endian)
+# Decoding logic was obtained from the MiTemperature2 repository by JsBergbau
+MI_LAYOUT = struct.Struct("<hBH")    # temperature (centi-degC), humidity (%), battery (mV)
+# Decoding logic was obtained from the middlware-rust repository by Joe Huang
+O2_LAYOUT = struct.Struct("<7xBH")   # spo2 (%), pulse rate (BPM)
+
+WILDCARD = "*"
+
+def _topic(value) -> frozenset | None:
+    # None or "*" matches everything, otherwise a single value or an iterable of values
+    if value is None or value == WILDCARD:
+        return None
+    return frozenset((value,) if isinstance(value, str) else value)
+
+class SubscriberQueue:
+    # Coroutine subscribers are fed by one long-lived worker through a bounded queue instead of a task per reading
+    __slots__ = ("owner", "sub", "name", "queue", "task", "delivered", "lag", "max_lag", "closed", "busy")
+
+    def __init__(self, owner, sub, name: str, size: int, policy: str):
+        self.owner = owner
+        self.sub = sub
+        self.name = name
+        self.queue = BoundedQueue(size, policy)
+        self.task: asyncio.Task | None = None
+        self.delivered = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.closed = False
+        self.busy = False
+
+    def offer(self, item) -> bool:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return self.queue.offer((time.monotonic(), item))
+
+    async def run(self):
+        while True:
+            queued_at, item = await self.queue.get()
+            start = time.monotonic()
+            self.busy = True
+            try:
+                await self.sub(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Hub] Subscriber {self.name} failed: {e}")
+            finally:
+                self.busy = False
+            self.delivered += 1
+            self.lag = start - queued_at
+            self.max_lag = max(self.max_lag, self.lag)
+            if metrics.ENABLED:
+                metrics.SUBSCRIBER_SECONDS.observe(time.monotonic() - start, self.name)
+
+    def stats(self) -> dict:
+        return {**self.queue.stats(), "delivered": self.delivered, "lag_ms": round(self.lag * 1000, 3), "max_lag_ms": round(self.max_lag * 1000, 3)}
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
 
 class NotificationHub:
     def __init__(self, interval: int | None, verbose: bool):
         self.subs = []
         self.interval = interval
         self.verbose = verbose
+        self.queue_size = 1024
+        self.overflow = DROP_OLDEST
+        self.queues: dict[object, SubscriberQueue] = {}
         self.latest_data = None
+        self.latest: dict[str | None, Reading] = {}
+        # Opt-in batching, subscribers declaring a `sub_batch` method receive columnar batches instead
+        self.batcher: MeasurementBatcher | None = None
+        self.batch_subs = {}
+        # Topic filters per subscriber as (sources, addresses), None being a wildcard. Dispatch reads the
+        # subscribers of each (source, address) from `routes`, which is reset whenever subscriptions change.
+        self.topics: dict[object, tuple[frozenset | None, frozenset | None]] = {}
+        self.routes: dict[tuple[str, str | None], tuple] = {}
 
     def remove(self, sub):
         if sub in self.subs:
             self.subs.remove(sub)
+        self.topics.pop(sub, None)
+        self.routes = {}
+        sub_batch = self.batch_subs.pop(sub, None)
+        for func in (sub, sub_batch):
+            queue = self.queues.pop(func, None)
+            if queue:
+                queue.cancel()
+                metrics.QUEUE_DEPTH.untrack(f"hub:{queue.name}")
+                metrics.QUEUE_DROPPED.untrack(f"hub:{queue.name}")
+                metrics.SUBSCRIBER_LAG.untrack(queue.name)
+
+    def set_dispatch(self, queue_size: int, overflow: str):
+        # Applies to coroutine subscribers registered afterwards
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+        self.queue_size = queue_size
+        self.overflow = overflow
 
     def set_interval(self, interval):
         self.interval = interval
 
-    def register(self, sub):
+    def set_batching(self, size: int | None, max_age: float | None):
+        if size or max_age:
+            self.batcher = MeasurementBatcher(size or 256, max_age or 1.0)
+        else:
+            self.flush_batches()
+            self.batcher = None
+
+    def register(self, sub, source: str | list[str] | None = None, address: str | list[str] | None = None,
+                 field: str | list[str] | None = None):
         if (sub not in self.subs):
             self.subs.append(sub)
+            sources = _topic(source)
+            fields = _topic(field)
+            if fields is not None:
+                # A field subscription is a subscription to the device types that report the field
+                with_fields = frozenset(name for name, record in RECORDS.items() if fields & set(record.FIELDS[1:]))
+                sources = with_fields if sources is None else sources & with_fields
+            addresses = _topic(address)
+            self.topics[sub] = (sources, frozenset(value.upper() for value in addresses) if addresses is not None else None)
+            self.routes = {}
+            sub_batch = getattr(getattr(sub, "__self__", None), "sub_batch", None)
+            if sub_batch:
+                self.batch_subs[sub] = sub_batch
+            for func in (sub, sub_batch):
+                if func and inspect.iscoroutinefunction(func):
+                    queue = self.queues[func] = SubscriberQueue(sub, func, self._sub_name(func), self.queue_size, self.overflow)
+                    metrics.QUEUE_DEPTH.track(lambda queue=queue: len(queue.queue), f"hub:{queue.name}")
+                    metrics.QUEUE_DROPPED.track(lambda queue=queue: queue.queue.dropped, f"hub:{queue.name}")
+                    metrics.SUBSCRIBER_LAG.track(lambda queue=queue: queue.lag, queue.name)
 
-    def handle_notify(self, characteristic: BleakGATTCharacteristic, data: bytearray):
-        decoded = {}
-        ts = time.time()
-
-        if characteristic.uuid == MI_NOTIFY_CHAR:
-            temp = self._decode_temp(data)
-            humid = self._decode_humid(data)
-            bat = self._decode_volt(data)
-
-            decoded = Measurement(
-                source="XIAOMI",
-                data= MiData(
-                    timestamp=ts,
-                    temperature=temp,
-                    humidity=humid,
-                    battery=bat
-                )
+    def route(self, source: str, address: str | None) -> tuple:
+        subs = self.routes.get((source, address))
+        if subs is None:
+            key = address.upper() if address else address
+            subs = self.routes[(source, address)] = tuple(
+                sub for sub in self.subs
+                if (self.topics[sub][0] is None or source in self.topics[sub][0])
+                and (self.topics[sub][1] is None or key in self.topics[sub][1])
             )
+        return subs
 
-        elif characteristic.uuid == O2_NOTIFY_CHAR:
-            if len(data) < 3: return
-            spo2 = self._decode_spo2(data)
-            pr = self._decode_pr(data)
-            
-            decoded = Measurement(
-                source="O2RING",
-                data= O2Data(
-                    timestamp=ts,
-                    spo2=spo2,
-                    pr=pr
-                )
-            )
+    def stats(self) -> dict[str, dict]:
+        return {queue.name: queue.stats() for queue in self.queues.values()}
+
+    async def close(self, timeout: float = 1.0):
+        # Give queued readings a chance to reach their subscribers before the workers are stopped
+        deadline = time.monotonic() + timeout
+        while any(queue.task and (len(queue.queue) or queue.busy) for queue in self.queues.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        for queue in self.queues.values():
+            queue.cancel()
+
+    def handle_notify(self, characteristic: BleakGATTCharacteristic, data: bytearray, address: str | None = None):
+        if metrics.ENABLED:
+            start = time.perf_counter()
+        uuid = characteristic.uuid
+
+        if uuid == MI_NOTIFY_CHAR or uuid == SIM_MI_CHAR:
+            if len(data) < MI_LAYOUT.size: return
+            temp, humid, volt = MI_LAYOUT.unpack_from(data)
+            decoded = Reading("XIAOMI", MiRecord(time.time(), temp / 100, humid, self._decode_battery(volt)), address)
+
+        elif uuid == O2_NOTIFY_CHAR or uuid == SIM_O2_CHAR:
+            if len(data) < O2_LAYOUT.size: return
+            spo2, pr = O2_LAYOUT.unpack_from(data)
+            decoded = Reading("O2RING", O2Record(time.time(), spo2, pr), address)
+
+        else:
+            return
 
-        self.latest_data = decoded
+        if metrics.ENABLED:
+            metrics.DECODE_SECONDS.observe(time.perf_counter() - start)
+            metrics.PACKETS_RECEIVED.inc(address or "")
+        self.publish(decoded)
+
+    def publish(self, reading: Reading):
+        self.latest_data = reading
+        self.latest[reading.address] = reading
         if not self.interval:
-            self._send_data(decoded)
+            self._send_data(reading)
 
     async def send_interval(self):
         while True:
-            if self.latest_data:
-                new_data = self.latest_data
-                new_data.data.timestamp = time.time()
-                self._send_data(new_data)
+            ts = time.time()
+            for data in list(self.latest.values()):
+                self._send_data(data.stamped(ts))
             await asyncio.sleep(self.interval)
 
-    def _send_data(self, data: Measurement):
+    async def send_batches(self):
+        while True:
+            await asyncio.sleep(self.batcher.max_age)
+            if self.batcher.due():
+                self._send_batches(self.batcher.drain())
+
+    def flush_batches(self):
+        if self.batcher:
+            self._send_batches(self.batcher.drain())
+
+    def _send_data(self, data: Reading):
         if (self.verbose):
             print(f"[Data] {data}")
-        for sub in self.subs:
-            if inspect.iscoroutinefunction(sub):
-                asyncio.create_task(sub(data))
+        batching = self.batcher is not None and self.batch_subs
+        timed = metrics.ENABLED
+        for sub in self.route(data.source, data.address):
+            if batching and sub in self.batch_subs:
+                continue
+            queue = self.queues.get(sub)
+            if queue is not None:
+                self._dispatch(queue, data)
+            elif timed:
+                start = time.perf_counter()
+                sub(data)
+                metrics.SUBSCRIBER_SECONDS.observe(time.perf_counter() - start, self._sub_name(sub))
             else:
                 sub(data)
+        if batching:
+            self._send_batches(self.batcher.add(data))
 
-    # Decoding logic was obtained from the MiTemperature2 repository by JsBergbau
-
-    def _decode_temp(self, data: bytearray):
-        return int.from_bytes(data[0:2], byteorder=sys.byteorder, signed=True) / 100
+    def _send_batches(self, batches: list[MeasurementBatch]):
+        for batch in batches:
+            for sub in self.route(batch.source, batch.address):
+                sub_batch = self.batch_subs.get(sub)
+                if sub_batch is None:
+                    continue
+                queue = self.queues.get(sub_batch)
+                if queue is not None:
+                    self._dispatch(queue, batch)
+                else:
+                    sub_batch(batch)
 
-    def _decode_humid(self, data: bytearray):
-        return int.from_bytes(data[2:3], byteorder=sys.byteorder)
-    
-    def _decode_volt(self, data: bytearray):
-        voltage =  int.from_bytes(data[3:5],byteorder=sys.byteorder) / 1000
-        return  min(int(round((voltage - 2.1),2) * 100), 100)
-    
-    # Decoding logic was obtained from the middlware-rust repository by Joe Huang
+    def _dispatch(self, queue: SubscriberQueue, item):
+        if not queue.offer(item) and not queue.closed:
+            # Only reachable with the 'disconnect' policy, removal is deferred as the subscriber list is being iterated
+            queue.closed = True
+            print(f"[Hub] Subscriber {queue.name} removed, its queue overflowed.")
+            asyncio.get_running_loop().call_soon(self.remove, queue.owner)
 
-    def _decode_spo2(self, data: bytearray):
-        return data[7]
+    def _sub_name(self, sub) -> str:
+        return getattr(sub, "__qualname__", None) or type(sub).__name__
 
-    def _decode_pr(self, data:bytearray):
-        return int.from_bytes(data[8:10], byteorder=sys.byteorder)
\ No newline at end of file
+    def _decode_battery(self, millivolts: int):
+        voltage = millivolts / 1000
+        return min(int(round((voltage - 2.1),2) * 100), 100)
@@ -1,7 +1,9 @@
 import os
+import time
+import random
 from bleak import BleakScanner, BleakClient
 import asyncio
-from core import NotificationHub
+from core import NotificationHub, metrics
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,23 +21,51 @@ ENABLE_REALTIME = bytes([0xAA, 0x17, 0xE8, 0x00, 0x00, 0x00, 0x00, 0x1B]) # From
 class SensorPipelineError(Exception):
     pass
 
+class BleakBackend:
+    notify_chars = (MI_NOTIFY_CHAR, O2_NOTIFY_CHAR)
+
+    def client(self, address: str, disconnected_callback=None) -> BleakClient:
+        return BleakClient(address, disconnected_callback=disconnected_callback)
+
+    async def discover(self, timeout: float = 10.0):
+        return await BleakScanner.discover(timeout=timeout)
+
 class SensorPipeline:
-    def __init__(self, interval: int  | None = None, verbose: bool = False):
-        self.hub = NotificationHub(interval, verbose)
+    def __init__(self, interval: int  | None = None, verbose: bool = False, hub: NotificationHub | None = None,
+                 reconnect: bool = False, watchdog: float | None = None, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 backend=None):
+        # Pipelines sharing a hub leave the hub-wide interval and batch tasks to its owner
+        self.owns_hub = hub is None
+        self.hub = hub or NotificationHub(interval, verbose)
+        # Device backend providing `client()` and `discover()`, e.g. core.simulator.SimulatedBackend
+        self.backend = backend or BleakBackend()
         self.client = None
         self.interval = interval
+        self.verbose = verbose
         self.address = None
         self._stop_event = asyncio.Event()
         # Only for O2Ring device
         self.send_task = None
         self.write_task = None
+        self.batch_task = None
+
+        # Reconnect supervisor, triggered by a disconnect callback or `watchdog` seconds without notifications
+        self.reconnect = reconnect
+        self.watchdog = watchdog
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.supervise_task = None
+        self.last_packet: float | None = None
+        self.reconnects = 0
+        self.reconnecting = False
+        self._link_lost = asyncio.Event()
 
     def set_interval(self, interval):
         self.interval = interval
         self.hub.set_interval(interval)
 
     async def scan(self, timeout: float = 10.0):
-        devices = await BleakScanner.discover(timeout=timeout)
+        devices = await self.backend.discover(timeout)
         return devices
     
     async def connect(self, address = None):
@@ -43,27 +73,50 @@ class SensorPipeline:
             self.address = address
         if not self.address:
             raise SensorPipelineError("BLE device MAC Address was not provided.")
-        
-        self.client = BleakClient(self.address)
+
+        try:
+            await self._open()
+        except BaseException:
+            # A client that connected but failed later (e.g. start_notify) must not stay connected behind the caller's back
+            await self._teardown()
+            raise
+
+        if self.interval and self.owns_hub:
+            self.send_task = asyncio.create_task(self.hub.send_interval())
+        if self.hub.batcher and self.owns_hub:
+            self.batch_task = asyncio.create_task(self.hub.send_batches())
+        if self.reconnect:
+            self.supervise_task = asyncio.create_task(self._supervise())
+        return
+
+    async def _open(self):
+        self._link_lost.clear()
+        self.client = self.backend.client(self.address, disconnected_callback=self._on_disconnect)
         await self.client.connect()
         if not self.client.is_connected:
             raise RuntimeError(f"Failed to connect to {self.address}.")
 
         notify_char = self._get_notify_char(self.client)
-        await self.client.start_notify(notify_char, self.hub.handle_notify)
+        self.last_packet = time.monotonic()
+        await self.client.start_notify(notify_char, self._on_notify)
 
         if self.client.name.startswith(O2_DEVICE_NAME):
             self.write_task = asyncio.create_task(self._write_to_o2ring(self.client))
 
-        if self.interval:
-            self.send_task = asyncio.create_task(self.hub.send_interval())
-        return
+    def _on_notify(self, characteristic, data: bytearray):
+        self.last_packet = time.monotonic()
+        self.hub.handle_notify(characteristic, data, self.address)
+
+    def _on_disconnect(self, client):
+        if client is self.client:
+            self._link_lost.set()
 
     def _get_notify_char(self, client):
+        mi_char, o2_char = self.backend.notify_chars
         if client.name == MI_DEVICE_NAME:
-            return MI_NOTIFY_CHAR
+            return mi_char
         elif client.name.startswith(O2_DEVICE_NAME):
-            return O2_NOTIFY_CHAR
+            return o2_char
         else:
             raise ValueError(f"Unknown BLE device type: {client.name}")
         
@@ -72,13 +125,73 @@ class SensorPipeline:
             await client.write_gatt_char(O2_WRITE_CHAR, ENABLE_REALTIME)
             await asyncio.sleep(interval or 1)
 
+    async def _supervise(self):
+        while True:
+            reason = await self._wait_for_link_loss()
+            if self.verbose:
+                print(f"[Pipeline] Lost {self.address} ({reason}), reconnecting...")
+
+            self.reconnecting = True
+            await self._teardown()
+            attempt = 0
+            while True:
+                # Full jitter keeps many sensors that dropped together from retrying in lockstep
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+                try:
+                    await self._open()
+                    break
+                except Exception as e:
+                    attempt += 1
+                    await self._teardown()
+                    if self.verbose:
+                        print(f"[Pipeline] Reconnect attempt {attempt} to {self.address} failed: {e}")
+            self.reconnects += 1
+            metrics.RECONNECTS.inc(self.address)
+            self.reconnecting = False
+            if self.verbose:
+                print(f"[Pipeline] Reconnected to {self.address}.")
+
+    async def _wait_for_link_loss(self) -> str:
+        period = min(self.watchdog, 1.0) if self.watchdog else 1.0
+        while True:
+            try:
+                await asyncio.wait_for(self._link_lost.wait(), timeout=period)
+                return "disconnected"
+            except asyncio.TimeoutError:
+                pass
+            if self.watchdog and time.monotonic() - self.last_packet > self.watchdog:
+                return f"no data for {self.watchdog}s"
+            if self.write_task and self.write_task.done() and not self.write_task.cancelled() and self.write_task.exception():
+                return f"write failed: {self.write_task.exception()}"
+
+    async def _teardown(self):
+        if self.write_task:
+            self.write_task.cancel()
+            self.write_task = None
+        client, self.client = self.client, None
+        if client:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
     async def close(self):
+        if self.supervise_task:
+            self.supervise_task.cancel()
+            self.supervise_task = None
         if self.send_task:
             self.send_task.cancel()
         if self.write_task:
             self.write_task.cancel()
+        if self.batch_task:
+            self.batch_task.cancel()
+        if self.owns_hub:
+            self.hub.flush_batches()
+            await self.hub.close()
+        self.hub.latest.pop(self.address, None)
 
         if self.client and self.client.is_connected:
             notify_char = self._get_notify_char(self.client)
             await self.client.stop_notify(notify_char)
-            await self.client.disconnect()
\ No newline at end of file
+            await self.client.disconnect()
@@ -0,0 +1,39 @@
+import asyncio
+
+# Overflow policies for bounded outbound queues
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+class BoundedQueue:
+    def __init__(self, maxsize: int = 1024, policy: str = DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.peak = 0
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def offer(self, item) -> bool:
+        # Returns False only when the queue is full under the 'disconnect' policy
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.policy == DISCONNECT:
+                return False
+            self.dropped += 1
+            if self.policy == DROP_OLDEST:
+                self.queue.get_nowait()
+                self.queue.put_nowait(item)
+        self.peak = max(self.peak, self.queue.qsize())
+        return True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def stats(self) -> dict:
+        return {"depth": len(self), "peak": self.peak, "dropped": self.dropped}
@@ -0,0 +1,118 @@
+import asyncio
+import random
+from types import SimpleNamespace
+from core.pipeline import MI_DEVICE_NAME, O2_DEVICE_NAME
+from core.notification_hub import MI_LAYOUT, O2_LAYOUT, SIM_MI_CHAR, SIM_O2_CHAR
+
+# Simulated BLE backend mirroring the subset of BleakClient/BleakScanner used by SensorPipeline,
+# so the hub, services and sinks can be load tested without hardware.
+
+DEVICE_KINDS = ("mi", "o2", "mixed")
+
+class SimulatedClient:
+    def __init__(self, address: str, name: str, rate: float, disconnected_callback=None, packets: list[bytes] | None = None):
+        self.address = address
+        self.name = name
+        self.rate = rate
+        self.packets = packets
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.writes = 0
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._temp, self._humid, self._spo2, self._pr = 2300, 50, 97, 70
+
+    async def connect(self):
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        if self.is_connected:
+            self.is_connected = False
+            if self.disconnected_callback:
+                self.disconnected_callback(self)
+        return True
+
+    async def start_notify(self, char, callback):
+        self._tasks[char] = asyncio.create_task(self._emit(SimpleNamespace(uuid=char), callback))
+
+    async def stop_notify(self, char):
+        task = self._tasks.pop(char, None)
+        if task:
+            task.cancel()
+
+    async def write_gatt_char(self, char, data, response: bool = False):
+        self.writes += 1
+
+    async def _emit(self, characteristic, callback):
+        # High rates are emitted in bursts per tick, asyncio cannot sleep for every packet at 10k/s
+        tick = max(1 / self.rate, 0.01)
+        per_tick = self.rate * tick
+        owed = 0.0
+        index = 0
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.is_connected:
+            owed += per_tick
+            while owed >= 1:
+                owed -= 1
+                if self.packets:
+                    packet = self.packets[index % len(self.packets)]
+                    index += 1
+                else:
+                    packet = self._synthesize()
+                callback(characteristic, bytearray(packet))
+            next_tick += tick
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+
+    def _synthesize(self) -> bytes:
+        if self.name.startswith(O2_DEVICE_NAME):
+            self._spo2 = min(100, max(90, self._spo2 + random.randint(-1, 1)))
+            self._pr = min(120, max(50, self._pr + random.randint(-2, 2)))
+            return O2_LAYOUT.pack(self._spo2, self._pr)
+        self._temp = min(4000, max(-1000, self._temp + random.randint(-5, 5)))
+        self._humid = min(99, max(1, self._humid + random.randint(-1, 1)))
+        return MI_LAYOUT.pack(self._temp, self._humid, 2950)
+
+def load_packets(path: str) -> list[bytes]:
+    # One hex-encoded notification payload per line, '#' starts a comment
+    packets = []
+    with open(path) as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                packets.append(bytes.fromhex(line))
+    return packets
+
+class SimulatedBackend:
+    # Simulated devices notify on their own characteristics, so they decode correctly without a .env file
+    notify_chars = (SIM_MI_CHAR, SIM_O2_CHAR)
+
+    def __init__(self, devices: int = 1, rate: float = 1.0, kind: str = "mi", recording: str | None = None):
+        if kind not in DEVICE_KINDS:
+            raise ValueError(f"Unknown simulated device kind '{kind}', expected one of {DEVICE_KINDS}")
+        if not rate > 0:
+            raise ValueError(f"Simulated devices need a positive packet rate, got {rate}")
+        self.rate = rate
+        self.packets = load_packets(recording) if recording else None
+        self.devices = []
+        for i in range(devices):
+            address = "5E:00:00:{:02X}:{:02X}:{:02X}".format((i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF)
+            is_o2 = kind == "o2" or (kind == "mixed" and i % 2)
+            name = f"{O2_DEVICE_NAME} {i:04d}" if is_o2 else MI_DEVICE_NAME
+            self.devices.append(SimpleNamespace(address=address, name=name))
+        self.names = {device.address: device.name for device in self.devices}
+
+    @property
+    def addresses(self) -> list[str]:
+        return [device.address for device in self.devices]
+
+    def client(self, address: str, disconnected_callback=None) -> SimulatedClient:
+        if address not in self.names:
+            raise RuntimeError(f"Device with address {address} was not found.")
+        return SimulatedClient(address, self.names[address], self.rate, disconnected_callback, self.packets)
+
+    async def discover(self, timeout: float = 10.0):
+        return list(self.devices)
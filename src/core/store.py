@@ -0,0 +1,246 @@
+import time
+import heapq
+import queue
+import sqlite3
+import threading
+import numpy as np
+from typing import Iterable
+from core.models import Reading, RECORDS
+from core.aggregate import bucket_layout, summarize, lttb
+
+# Persistent history in SQLite: one table per device type with typed columns and a (device, timestamp) index.
+# Writes are queued to a single writer thread and committed in batches, readers use their own WAL connections.
+
+INF = float("inf")
+# Store-backed queries never return more than MAX_LIMIT readings, DEFAULT_LIMIT applies when no limit is given
+DEFAULT_LIMIT = 10000
+MAX_LIMIT = 100000
+FETCH_ROWS = 10000
+SQL_AGGREGATES = {"min": "MIN", "max": "MAX", "mean": "AVG"}
+# LTTB runs on the minimum and maximum of this many sub-buckets per output point instead of on every row
+LTTB_OVERSAMPLING = 4
+
+class SQLiteStore:
+    def __init__(self, path: str, batch_size: int = 1000, commit_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.tables = {source: source.lower() for source in RECORDS}
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+        # Statements are built once, sqlite3 keeps them compiled in each connection's statement cache
+        self._insert = {}
+        self._select = {}
+        for source, table in self.tables.items():
+            fields = RECORDS[source].FIELDS
+            columns = ", ".join(fields)
+            self._insert[source] = f"INSERT INTO {table} (device, {columns}) VALUES (?, {', '.join('?' * len(fields))})"
+            for order in ("ASC", "DESC"):
+                self._select[source, order, False] = f"SELECT device, {columns} FROM {table} WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp {order} LIMIT ?"
+                self._select[source, order, True] = f"SELECT device, {columns} FROM {table} WHERE device = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp {order} LIMIT ?"
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            for source, table in self.tables.items():
+                record = RECORDS[source]
+                columns = ", ".join(f"{field} {'REAL' if code == 'd' else 'INTEGER'}" for field, code in zip(record.FIELDS, record.TYPECODES))
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (device TEXT, {columns})")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_device_timestamp ON {table} (device, timestamp)")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_timestamp ON {table} (timestamp)")
+        connection.close()
+
+        self.written = 0
+        self.thread = threading.Thread(target=self._write_loop, name="sqlite-store", daemon=True)
+        self.thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Reader connections are opened on worker threads and closed from the thread calling `close`
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            with self._readers_lock:
+                self._readers.append(connection)
+        return connection
+
+    def append(self, reading: Reading):
+        self.queue.put(reading)
+
+    def extend(self, readings: Iterable[Reading]):
+        self.queue.put(list(readings))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # Blocks until everything queued so far is committed
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        connection = self._connect()
+        pending = {source: [] for source in RECORDS}
+        count = 0
+        deadline = None
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()) if count else None)
+            except queue.Empty:
+                item = ()
+
+            if item is None or isinstance(item, threading.Event):
+                count = self._commit(connection, pending, count)
+                deadline = None
+                if item is None:
+                    break
+                item.set()
+                continue
+
+            for reading in item if isinstance(item, (list, tuple)) else (item,):
+                pending[reading.source].append((reading.address, *reading.data.astuple()))
+                count += 1
+            if count and deadline is None:
+                deadline = time.monotonic() + self.commit_interval
+            if count >= self.batch_size or (count and time.monotonic() >= deadline):
+                count = self._commit(connection, pending, count)
+                deadline = None
+        connection.close()
+
+    def _commit(self, connection: sqlite3.Connection, pending: dict[str, list], count: int) -> int:
+        if not count:
+            return 0
+        try:
+            with connection:
+                for source, rows in pending.items():
+                    if rows:
+                        connection.executemany(self._insert[source], rows)
+            self.written += count
+        except sqlite3.Error as e:
+            print(f"[Store] Could not write {count} readings: {e}")
+        for rows in pending.values():
+            rows.clear()
+        return 0
+
+    def query(self, since: float | None = None, until: float | None = None, limit: int | None = None,
+              device: str | None = None) -> list[Reading]:
+        # Same semantics as HistoryBuffer.query: with `since`, page forward, otherwise return the most recent readings.
+        # Months of history do not fit in one response, so the number of readings is always bounded.
+        limit = min(DEFAULT_LIMIT if limit is None else limit, MAX_LIMIT)
+        newest = since is None and limit is not None
+        order = "DESC" if newest else "ASC"
+        bounds = (-INF if since is None else since, INF if until is None else until, -1 if limit is None else limit)
+        params = ((device,) if device is not None else ()) + bounds
+
+        connection = self._reader()
+        streams = []
+        for source, record in RECORDS.items():
+            rows = connection.execute(self._select[source, order, device is not None], params).fetchall()
+            streams.append([Reading(source, record(*row[1:]), row[0]) for row in rows])
+
+        readings = heapq.merge(*streams, key=lambda reading: reading.data.timestamp, reverse=newest)
+        if limit is not None:
+            readings = (reading for _, reading in zip(range(limit), readings))
+        readings = list(readings)
+        if newest:
+            readings.reverse()
+        return readings
+
+    def _fields(self, source: str, fields: Iterable[str]) -> list[str]:
+        fields = list(fields)
+        if unknown := [field for field in fields if field not in RECORDS[source].FIELDS[1:]]:
+            raise ValueError(f"Unknown fields {unknown} for {source}")
+        return fields
+
+    def _where(self, since: float | None, until: float | None, device: str | None) -> tuple[str, tuple]:
+        where = "timestamp >= ? AND timestamp <= ?"
+        params = (-INF if since is None else since, INF if until is None else until)
+        if device is not None:
+            return "device = ? AND " + where, (device, *params)
+        return where, params
+
+    def columns(self, source: str, fields: Iterable[str], since: float | None = None, until: float | None = None,
+                device: str | None = None):
+        fields = self._fields(source, fields)
+        table = self.tables[source]
+        where, params = self._where(since, until, device)
+        sql = f"SELECT timestamp{''.join(', ' + field for field in fields)} FROM {table} WHERE {where} ORDER BY timestamp"
+        cursor = self._reader().execute(sql, params)
+        # Rows are converted chunk by chunk, only the float64 columns are held in full
+        chunks = []
+        while rows := cursor.fetchmany(FETCH_ROWS):
+            chunks.append(np.array(rows, dtype=np.float64))
+        data = np.concatenate(chunks) if chunks else np.empty((0, len(fields) + 1))
+        return data[:, 0], {field: data[:, i + 1] for i, field in enumerate(fields)}
+
+    def aggregate(self, source: str, fields: Iterable[str], funcs: list[str], width: float | None = None, buckets: int | None = None,
+                  since: float | None = None, until: float | None = None, device: str | None = None) -> dict:
+        # Buckets are computed by SQLite, at most one row per bucket leaves the database
+        fields = self._fields(source, fields)
+        table = self.tables[source]
+        where, params = self._where(since, until, device)
+        connection = self._reader()
+
+        first, last = connection.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} WHERE {where}", params).fetchone()
+        if first is None:
+            return summarize(np.empty(0), {field: np.empty(0) for field in fields}, funcs, width, buckets)
+        width, origin, buckets = bucket_layout(first, last, width, buckets)
+        bucket = "CAST((timestamp - ?) / ? AS INTEGER)"
+
+        stats = [(field, func) for field in fields for func in funcs if func in SQL_AGGREGATES]
+        columns = "".join(f", {SQL_AGGREGATES[func]}({field})" for field, func in stats)
+        rows = connection.execute(
+            f"SELECT {bucket} AS bucket, COUNT(*){columns} FROM {table} WHERE {where} GROUP BY bucket ORDER BY bucket", (origin, width, *params)
+        ).fetchall()
+        result = {
+            "width": width,
+            "timestamp": [origin + row[0] * width for row in rows],
+            "count": [row[1] for row in rows],
+            **{field: {} for field in fields},
+        }
+        for i, (field, func) in enumerate(stats):
+            result[field][func] = [float(row[i + 2]) for row in rows]
+
+        if "last" in funcs:
+            # With a single MAX() aggregate, SQLite takes the other columns from the row holding the maximum
+            rows = connection.execute(
+                f"SELECT {bucket} AS bucket, MAX(timestamp), {', '.join(fields)} FROM {table} WHERE {where} GROUP BY bucket ORDER BY bucket",
+                (origin, width, *params),
+            ).fetchall()
+            for i, field in enumerate(fields):
+                result[field]["last"] = [float(row[i + 2]) for row in rows]
+
+        if "lttb" in funcs:
+            # MinMaxLTTB: the extremes of each sub-bucket are the candidates LTTB chooses from
+            sub_width = float(last - first) / (buckets * LTTB_OVERSAMPLING) * (1 + 1e-9) or 1.0
+            for field in fields:
+                candidates = {}
+                for func in ("MIN", "MAX"):
+                    for value, timestamp in connection.execute(
+                        f"SELECT {func}({field}), timestamp FROM {table} WHERE {where} GROUP BY {bucket}", (*params, first, sub_width)
+                    ):
+                        candidates[timestamp] = value
+                for order in ("ASC", "DESC"):
+                    for timestamp, value in connection.execute(
+                        f"SELECT timestamp, {field} FROM {table} WHERE {where} ORDER BY timestamp {order} LIMIT 1", params
+                    ):
+                        candidates[timestamp] = value
+                timestamps = np.array(sorted(candidates), dtype=np.float64)
+                values = np.array([candidates[timestamp] for timestamp in timestamps.tolist()], dtype=np.float64)
+                selected = lttb(timestamps, values, buckets)
+                result[field]["lttb"] = {"timestamp": timestamps[selected].tolist(), "value": values[selected].tolist()}
+        return result
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        with self._readers_lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers.clear()
+        self._local = threading.local()
@@ -0,0 +1,69 @@
+import struct
+from core.models import Reading, RECORDS
+from core.encoding import Encoder
+
+# Compact binary records: source id, timestamp, then the device fields.
+# Temperatures are sent as centi-degrees in an int16, every other field keeps its integer type.
+
+FRAME_HEADER = struct.Struct("<H")   # byte length of the record and device address that follow
+# UDP datagrams: version, sequence number, device MAC address (zeros when unknown), record count, then the records
+DATAGRAM_HEADER = struct.Struct("<BI6sB")
+DATAGRAM_VERSION = 1
+
+SOURCE_IDS = {"XIAOMI": 1, "O2RING": 2}
+SOURCES = {source_id: source for source, source_id in SOURCE_IDS.items()}
+
+RECORD_LAYOUTS = {
+    "XIAOMI": struct.Struct("<BdhBh"),   # timestamp, temperature, humidity, battery
+    "O2RING": struct.Struct("<BdBH"),    # timestamp, spo2, pr
+}
+RECORD_SCALES = {
+    "XIAOMI": (1, 100, 1, 1),
+    "O2RING": (1, 1, 1),
+}
+
+def pack_record(reading: Reading) -> bytes:
+    values = [
+        value if scale == 1 else round(value * scale)
+        for value, scale in zip(reading.data.astuple(), RECORD_SCALES[reading.source])
+    ]
+    return RECORD_LAYOUTS[reading.source].pack(SOURCE_IDS[reading.source], *values)
+
+def pack_address(address: str | None) -> bytes:
+    # Platforms that hide MAC addresses (e.g. macOS UUIDs) are sent as zeros
+    try:
+        packed = bytes.fromhex(address.replace(":", "")) if address else b""
+    except ValueError:
+        packed = b""
+    return packed if len(packed) == 6 else bytes(6)
+
+def unpack_address(packed: bytes) -> str | None:
+    return ":".join(f"{byte:02X}" for byte in packed) if any(packed) else None
+
+def unpack_record(buffer, offset: int = 0, address: str | None = None) -> Reading:
+    source = SOURCES[buffer[offset]]
+    _source_id, *values = RECORD_LAYOUTS[source].unpack_from(buffer, offset)
+    values = [value if scale == 1 else value / scale for value, scale in zip(values, RECORD_SCALES[source])]
+    return Reading(source, RECORDS[source](*values), address)
+
+def unpack_frame(body: bytes) -> Reading:
+    # Frame body without its length header: the record, then the device address
+    return unpack_record(body, 0, unpack_address(body[-6:]))
+
+class JSONLineEncoder(Encoder):
+    name = "json-line"
+
+    def encode(self, reading: Reading) -> bytes:
+        return reading.payload() + b"\n"
+
+class BinaryFrameEncoder(Encoder):
+    name = "binary-frame"
+
+    def encode(self, reading: Reading) -> bytes:
+        record = pack_record(reading) + pack_address(reading.address)
+        return FRAME_HEADER.pack(len(record)) + record
+
+FRAMINGS: dict[str, Encoder] = {
+    "json": JSONLineEncoder(),
+    "binary": BinaryFrameEncoder(),
+}
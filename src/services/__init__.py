@@ -3,6 +3,10 @@
 from .api_server import APIServer
 from .socket_server import SocketServer
 from .ws_server import WebSocketServer
+from .multicast_publisher import MulticastPublisher
+from .shm_publisher import SharedMemoryPublisher
 from .file_logger import FileLogger
+from .parquet_logger import ParquetLogger
+from .routing_logger import RoutingLogger
 
-__all__ = ["APIServer", "SocketServer", "FileLogger", "WebSocketServer"]
\ No newline at end of file
+__all__ = ["APIServer", "SocketServer", "FileLogger", "ParquetLogger", "RoutingLogger", "WebSocketServer", "MulticastPublisher", "SharedMemoryPublisher"]
\ No newline at end of file
@@ -1,49 +1,241 @@
+import contextlib
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI
-from core import Measurement
+from fastapi import FastAPI, HTTPException, Response, Header
+from fastapi.responses import StreamingResponse
+from core import Measurement, Reading, MeasurementBatch, HistoryBuffer, SQLiteStore, metrics
+from core.models import RECORDS
+from core.queues import BoundedQueue, DROP_OLDEST
+from core.aggregate import AGGREGATES, MAX_BUCKETS
 from urllib.parse import urlparse
 import uvicorn
 import asyncio
 
+API_MODES = ("loop", "thread")
+STREAM_QUEUE_SIZE = 1024
+STREAM_KEEPALIVE = 15.0
+STREAM_REPLAY_PAGE = 1000
+
+class StreamChannel:
+    __slots__ = ("queue", "devices", "sources", "loop")
+
+    def __init__(self, devices: set[str] | None, sources: set[str] | None, loop: asyncio.AbstractEventLoop):
+        self.queue = BoundedQueue(STREAM_QUEUE_SIZE, DROP_OLDEST)
+        self.devices = devices
+        self.sources = sources
+        self.loop = loop
+
+    def matches(self, reading: Reading) -> bool:
+        return (self.sources is None or reading.source in self.sources) and (self.devices is None or reading.address in self.devices)
+
+class LoopServer(uvicorn.Server):
+    # When uvicorn shares the program's event loop, the program keeps ownership of signal handling
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+    def install_signal_handlers(self):
+        pass
+
 class APIServer:
-    def __init__(self, uri = None):
+    def __init__(self, uri = None, history_size: int = 86400, history_age: float | None = None, store: SQLiteStore | None = None,
+                 mode: str = "loop", workers: int = 1):
+        if mode not in API_MODES:
+            raise ValueError(f"Unknown API mode '{mode}', expected one of {API_MODES}")
+        if mode == "loop" and workers != 1:
+            raise ValueError("The in-loop API server runs a single worker, use the thread mode for several workers.")
         self.app = FastAPI()
         self.uri = uri
-        self.latest_data: Measurement | None = None
-        self.data_history: list[Measurement] = []
-        self.executor = ThreadPoolExecutor(1)
+        # "loop" serves requests on the caller's event loop, next to the hub that feeds it.
+        # "thread" runs `workers` uvicorn servers in threads sharing one listening socket.
+        self.mode = mode
+        self.workers = workers
+        self.store = store
+        self.latest_data: Reading | None = None
+        # A persistent store replaces the in-memory ring, both serve the same queries
+        self.data_history = store or HistoryBuffer(history_size, history_age)
+        self.executor = ThreadPoolExecutor(workers) if mode == "thread" else None
         
-        self.app.get("/data")(self.get_latest_data)
-        self.app.get("/history")(self.get_data_history)
+        self.app.get("/data", response_model=Measurement | None)(self.get_latest_data)
+        self.app.get("/history", response_model=list[Measurement])(self.get_data_history)
+        self.app.get("/history/aggregate")(self.get_aggregated_history)
+        self.app.get("/metrics")(self.get_metrics)
+        self.app.get("/stream")(self.get_stream)
 
-        self.server: uvicorn.Server | None = None
-        self.task: asyncio.Task | None = None
+        self.servers: list[uvicorn.Server] = []
+        self.tasks: list[asyncio.Future] = []
+        self.streams: set[StreamChannel] = set()
+        self.loop: asyncio.AbstractEventLoop | None = None
     
-    def sub(self, data: Measurement):
+    def sub(self, data: Reading):
         self.latest_data = data
         self.data_history.append(data)
+        if self.streams:
+            self._publish(data)
+
+    def sub_batch(self, batch: MeasurementBatch):
+        self.latest_data = batch.last()
+        readings = list(batch.readings())
+        self.data_history.extend(readings)
+        if self.streams:
+            for reading in readings:
+                self._publish(reading)
+
+    def _publish(self, reading: Reading):
+        for channel in list(self.streams):
+            if channel.matches(reading):
+                # Streams opened on a uvicorn thread (thread mode) own their own loop
+                if channel.loop is self.loop:
+                    channel.queue.offer(reading)
+                else:
+                    channel.loop.call_soon_threadsafe(channel.queue.offer, reading)
+    
+    async def _read(self, query, *args):
+        # The in-memory history is only read on the loop that writes it. In thread mode, handlers run on a
+        # uvicorn loop of their own, so the read is handed over to the program's loop.
+        # The SQLite store does disk I/O and is queried from a worker thread instead.
+        if self.store is not None:
+            return await asyncio.to_thread(query, *args)
+        if self.loop is not None and asyncio.get_running_loop() is not self.loop:
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._query(query, *args), self.loop))
+        return query(*args)
+
+    async def _query(self, query, *args):
+        return query(*args)
+
+    # Readings are served from their cached JSON payloads instead of being re-serialized per request
+
+    async def get_latest_data(self):
+        content = self.latest_data.payload() if self.latest_data else b"null"
+        return Response(content, media_type="application/json")
     
-    def get_latest_data(self):
-        return self.latest_data
+    async def get_data_history(self, since: float | None = None, until: float | None = None, limit: int | None = None,
+                               device: str | None = None):
+        readings = await self._read(self.data_history.query, since, until, limit, device)
+        content = b"[" + b",".join(data.payload() for data in readings) + b"]"
+        return Response(content, media_type="application/json")
     
-    def get_data_history(self):
-        return self.data_history
+    async def get_aggregated_history(self, source: str, width: float | None = None, buckets: int | None = None,
+                                     funcs: str = "min,max,mean,last", fields: str | None = None,
+                                     since: float | None = None, until: float | None = None, device: str | None = None):
+        if source not in RECORDS:
+            raise HTTPException(400, f"Unknown source '{source}', expected one of {list(RECORDS)}.")
+        all_fields = RECORDS[source].FIELDS[1:]
+        fields = [field.strip() for field in fields.split(",")] if fields else list(all_fields)
+        funcs = [func.strip() for func in funcs.split(",") if func.strip()]
+        if unknown := [field for field in fields if field not in all_fields]:
+            raise HTTPException(400, f"Unknown fields {unknown} for {source}, expected {list(all_fields)}.")
+        if unknown := [func for func in funcs if func not in AGGREGATES]:
+            raise HTTPException(400, f"Unknown aggregates {unknown}, expected {list(AGGREGATES)}.")
+        if (width is None) == (buckets is None):
+            raise HTTPException(400, "Exactly one of 'width' or 'buckets' must be provided.")
+        if (width is not None and width <= 0) or (buckets is not None and not 0 < buckets <= MAX_BUCKETS):
+            raise HTTPException(400, f"'width' must be positive and 'buckets' between 1 and {MAX_BUCKETS}.")
+
+        try:
+            result = await self._read(self.data_history.aggregate, source, fields, funcs, width, buckets, since, until, device)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return {"source": source, **result}
+    
+    async def get_stream(self, device: str | None = None, source: str | None = None, since: float | None = None,
+                         last_event_id: str | None = Header(None)):
+        devices = {value.strip() for value in device.split(",") if value.strip()} if device else None
+        sources = {value.strip() for value in source.split(",") if value.strip()} if source else None
+        if sources and (unknown := sources - set(RECORDS)):
+            raise HTTPException(400, f"Unknown sources {sorted(unknown)}, expected one of {list(RECORDS)}.")
+        # Event ids are reading timestamps, so a reconnecting EventSource resumes right after the last event it saw
+        after = None
+        if last_event_id:
+            try:
+                after = float(last_event_id)
+            except ValueError:
+                raise HTTPException(400, "Last-Event-ID must be a reading timestamp.")
+
+        # Registered before reading the history so nothing published in between is missed
+        channel = StreamChannel(devices, sources, asyncio.get_running_loop())
+        self.streams.add(channel)
+        start = after if after is not None else since
+        device = next(iter(devices)) if devices and len(devices) == 1 else None
+
+        async def events():
+            try:
+                sent = None
+                # The history is replayed in pages, so a resume over a long gap never loads it all at once
+                seen = set()
+                while start is not None:
+                    queried = start if sent is None else sent
+                    page = await self._read(self.data_history.query, queried, None, STREAM_REPLAY_PAGE, device)
+                    for reading in page:
+                        ts = reading.data.timestamp
+                        if (after is not None and ts <= after) or (ts == sent and (reading.source, reading.address) in seen):
+                            continue
+                        if ts != sent:
+                            seen.clear()
+                        seen.add((reading.source, reading.address))
+                        sent = ts
+                        if channel.matches(reading):
+                            yield self._event(reading)
+                    if len(page) < STREAM_REPLAY_PAGE or page[-1].data.timestamp == queried:
+                        break
+                while True:
+                    try:
+                        reading = await asyncio.wait_for(channel.queue.get(), STREAM_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                    if reading is None:
+                        return
+                    if sent is not None and reading.data.timestamp <= sent:
+                        continue
+                    sent = None
+                    yield self._event(reading)
+            finally:
+                self.streams.discard(channel)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    def _event(self, reading: Reading) -> bytes:
+        return b"id: " + repr(reading.data.timestamp).encode() + b"\ndata: " + reading.payload() + b"\n\n"
+
+    async def get_metrics(self):
+        # Prometheus text exposition format, metrics are only collected when enabled with --metrics
+        return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
     
     async def start(self, uri: str = None):
         if uri: self.uri = uri
         parsed = urlparse(self.uri)
         host, port = parsed.hostname, parsed.port
 
+        self.loop = asyncio.get_running_loop()
         config = uvicorn.Config(self.app, host=host, port=port, log_config=None, loop="asyncio", lifespan="off", interface="asgi3")
-        self.server = uvicorn.Server(config)
+        config.load()
+        try:
+            # Bound here so a busy port fails start() instead of exiting from inside uvicorn
+            sock = config.bind_socket()
+        except SystemExit:
+            raise OSError(f"Could not bind the API server to {host}:{port}.") from None
+
+        if self.mode == "loop":
+            server = LoopServer(config)
+            self.servers = [server]
+            self.tasks = [asyncio.create_task(server.serve([sock]))]
+            return self
 
         loop = asyncio.get_running_loop()
-        self.task = loop.run_in_executor(self.executor, self.server.run)
+        self.servers = [uvicorn.Server(config) for _ in range(self.workers)]
+        self.tasks = [loop.run_in_executor(self.executor, server.run, [sock]) for server in self.servers]
         return self
     
     async def close(self):
-        if self.server:
-            self.server.should_exit = True
-        if self.task:
-            await self.task
-        self.executor.shutdown(wait=False)
\ No newline at end of file
+        # Open streams would otherwise keep uvicorn waiting for their responses to finish
+        for channel in list(self.streams):
+            if channel.loop is self.loop:
+                channel.queue.offer(None)
+            else:
+                channel.loop.call_soon_threadsafe(channel.queue.offer, None)
+        for server in self.servers:
+            server.should_exit = True
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.executor:
+            self.executor.shutdown(wait=False)
@@ -1,29 +1,237 @@
+import io
+import os
 import csv
-from core import Measurement
+import gzip
+import json
+import time
+import shutil
+import asyncio
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from core import Reading, MeasurementBatch
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ROTATION_PERIODS = ("hourly", "daily")
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+def compress_segment(path: str, compression: str) -> str:
+    target = path + COMPRESSIONS[compression]
+    with open(path, "rb") as source, open(target, "wb") as destination:
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=destination, mode="wb") as stream:
+                shutil.copyfileobj(source, stream)
+        else:
+            zstandard.ZstdCompressor().copy_stream(source, destination)
+    os.remove(path)
+    return target
+
+def read_manifest(filename: str) -> list[dict]:
+    try:
+        with open(filename + ".manifest.jsonl") as file:
+            return [json.loads(line) for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def find_segments(filename: str, since: float | None = None, until: float | None = None) -> list[str]:
+    # Segments whose time range overlaps [since, until], without opening any of them
+    directory = os.path.dirname(filename)
+    return [
+        os.path.join(directory, entry["file"]) for entry in read_manifest(filename)
+        if (since is None or entry["end"] >= since) and (until is None or entry["start"] <= until)
+    ]
 
 class FileLogger:
-    def __init__(self, filename, action):
+    def __init__(self, filename, action, buffer_size: int | None = None, flush_interval: float | None = None, fsync: bool = False,
+                 rotate_size: int | None = None, rotate_every: str | None = None, compression: str | None = None,
+                 executor: ThreadPoolExecutor | None = None):
+        if rotate_every is not None and rotate_every not in ROTATION_PERIODS:
+            raise ValueError(f"Unknown rotation period '{rotate_every}', expected one of {ROTATION_PERIODS}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {list(COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requires zstandard, install it with 'pip install zstandard'.")
         self.filename = filename
         self.action = action
         self.file = None
         self.writer = None
         self.header: bool = None
-        self.open(self.filename, self.action)
+        # Buffered mode keeps rows in memory until `buffer_size` bytes or `flush_interval` seconds accumulate,
+        # otherwise every row is written through line buffering
+        self.buffered = bool(buffer_size or flush_interval)
+        self.buffer_size = buffer_size or 256 * 1024
+        self.flush_interval = flush_interval or 5.0
+        self.fsync = fsync
+        self.buffer: io.StringIO | None = None
+        self.flushed_at = time.monotonic()
+
+        # With rotation, data goes to timestamped segments and closed segments are compressed off the event loop
+        self.rotating = bool(rotate_size or rotate_every)
+        self.rotate_size = rotate_size
+        self.rotate_every = rotate_every
+        self.compression = compression
+        # Loggers may share one executor (RoutingLogger), only an executor created here is shut down on close
+        self.owns_executor = executor is None
+        self.executor = (executor or ThreadPoolExecutor(1)) if self.rotating else None
+        self.suspended = False
+        self.path: str | None = None
+        self.rotate_at: float | None = None
+        self.segment_bytes = 0
+        self.segment_rows = 0
+        self.segment_range: list[float] | None = None
+
+        if self.rotating:
+            self._open_segment()
+        else:
+            self.open(self.filename, self.action)
 
     def open(self, filename: str, action: str):
-        self.file = open(filename + '.csv', action, newline="", buffering=1)
-        self.writer = csv.writer(self.file)
+        if self.buffered:
+            self.file = open(filename + '.csv', action, newline="")
+            self.buffer = io.StringIO(newline="")
+            self.writer = csv.writer(self.buffer)
+        else:
+            self.file = open(filename + '.csv', action, newline="", buffering=1)
+            self.writer = csv.writer(self.file)
         self.header = action != "w"
+        self.flushed_at = time.monotonic()
+
+    def sub(self, data: Reading):
+        if self.suspended:
+            self._resume()
+        if not self.header:
+            self._write_header(data.source)
 
-    def sub(self, data: Measurement):
+        row = data.data.astuple()
+        self.writer.writerow(row)
+        if self.rotating:
+            self._track(row[0], row[0], 1)
+        if self.buffered:
+            self._flush_if_due()
+
+    def sub_batch(self, batch: MeasurementBatch):
+        if self.suspended:
+            self._resume()
         if not self.header:
-            if data.source == "XIAOMI":
-                self.writer.writerow(["Timestamp_s", "Temperature_C", "Humidity_%", "Battery_%"])
-            if data.source == "O2RING":
-                self.writer.writerow(["Timestamp_s", "SpO2_%", "PulseRate_BPM"])
-            self.header = True
-
-        self.writer.writerow([value for _key, value in data.data])
-    
+            self._write_header(batch.source)
+
+        self.writer.writerows(batch.rows())
+        if self.rotating and len(batch):
+            timestamps = batch.columns["timestamp"]
+            self._track(timestamps[0], timestamps[-1], len(batch))
+        if self.buffered:
+            self._flush_if_due()
+
+    def _flush_if_due(self):
+        if self.buffer.tell() >= self.buffer_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.file is None or self.file.closed:
+            return
+        if self.buffer is not None and self.buffer.tell():
+            chunk = self.buffer.getvalue()
+            self.file.write(chunk)
+            self.segment_bytes += len(chunk)
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.flushed_at = time.monotonic()
+
+    async def flush_periodically(self):
+        # Bounds the age of buffered rows when readings stop arriving
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def _write_header(self, source: str):
+        if source == "XIAOMI":
+            self.writer.writerow(["Timestamp_s", "Temperature_C", "Humidity_%", "Battery_%"])
+        if source == "O2RING":
+            self.writer.writerow(["Timestamp_s", "SpO2_%", "PulseRate_BPM"])
+        self.header = True
+
+    def _track(self, first: float, last: float, rows: int):
+        if self.segment_range is None:
+            self.segment_range = [first, last]
+        else:
+            self.segment_range[0] = min(self.segment_range[0], first)
+            self.segment_range[1] = max(self.segment_range[1], last)
+        self.segment_rows += rows
+
+        # Line-buffered files are already written through, buffered ones are counted as they are flushed
+        size = self.segment_bytes + self.buffer.tell() if self.buffered else self.file.tell()
+        if (self.rotate_size and size >= self.rotate_size) or (self.rotate_at and time.time() >= self.rotate_at):
+            self.rotate()
+
+    def _open_segment(self):
+        now = datetime.now()
+        path = f"{self.filename}-{now:%Y%m%d-%H%M%S}"
+        part = 1
+        while any(os.path.exists(path + ".csv" + extension) for extension in ("", *COMPRESSIONS.values())):
+            path = f"{self.filename}-{now:%Y%m%d-%H%M%S}-{part}"
+            part += 1
+        self.path = path + ".csv"
+        # Every segment is a new file with its own header, append mode never reopens a large file
+        self.open(path, "w")
+        self.segment_bytes = 0
+        self.segment_rows = 0
+        self.segment_range = None
+        if self.rotate_every == "hourly":
+            self.rotate_at = (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        elif self.rotate_every == "daily":
+            self.rotate_at = (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+    def _close_segment(self):
+        self.flush()
+        self.file.close()
+        if self.segment_rows:
+            entry = {"start": self.segment_range[0], "end": self.segment_range[1], "rows": self.segment_rows}
+            self.executor.submit(self._finish_segment, self.path, entry)
+        else:
+            os.remove(self.path)
+
+    def _finish_segment(self, path: str, entry: dict):
+        # Runs on the logger's single worker thread, so manifest lines are appended in segment order
+        try:
+            if self.compression:
+                path = compress_segment(path, self.compression)
+            entry = {"file": os.path.basename(path), **entry, "bytes": os.path.getsize(path)}
+            with open(self.filename + ".manifest.jsonl", "a") as manifest:
+                manifest.write(json.dumps(entry) + "\n")
+        except Exception as e:
+            print(f"[Logger] Could not finish segment {path}: {e}")
+
+    def rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+    def suspend(self):
+        # Releases the file handle only, the next write reopens the same file or segment for appending
+        if self.file is None or self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        self.suspended = True
+
+    def _resume(self):
+        self.open(self.path[:-len(".csv")] if self.rotating else self.filename, "a")
+        self.suspended = False
+
     def close(self):
-        self.file.close()
\ No newline at end of file
+        if self.file is None or (self.file.closed and not self.suspended):
+            return
+        self.suspended = False
+        if self.rotating:
+            self._close_segment()
+            if self.owns_executor:
+                self.executor.shutdown(wait=True)
+        else:
+            self.flush()
+            self.file.close()
@@ -0,0 +1,71 @@
+import time
+import socket
+from core import Reading, MeasurementBatch, metrics
+from core.wire import DATAGRAM_HEADER, DATAGRAM_VERSION, RECORD_LAYOUTS, pack_record, pack_address
+
+# One datagram per reading (or per batch chunk) reaches every receiver that joined the group.
+# Sequence numbers count datagrams so receivers can detect losses.
+MAX_DATAGRAM = 1400   # stays below a typical Ethernet MTU
+MAX_RECORDS = 255
+
+class MulticastPublisher:
+    def __init__(self, group: str, port: int, ttl: int = 1, interface: str | None = None, verbose: bool = False):
+        self.group = group
+        self.port = port
+        self.ttl = ttl
+        self.interface = interface
+        self.verbose = verbose
+        self.sock: socket.socket | None = None
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if self.interface:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+        self.sock.setblocking(False)
+        if self.verbose:
+            print(f"[Multicast] Publishing to {self.group}:{self.port}.")
+        return self
+
+    def sub(self, data: Reading):
+        if self.sock:
+            self._send(pack_address(data.address), 1, pack_record(data))
+
+    def sub_batch(self, batch: MeasurementBatch):
+        if not self.sock:
+            return
+        address = pack_address(batch.address)
+        per_datagram = min(MAX_RECORDS, (MAX_DATAGRAM - DATAGRAM_HEADER.size) // RECORD_LAYOUTS[batch.source].size)
+        records = [pack_record(reading) for reading in batch.readings()]
+        for start in range(0, len(records), per_datagram):
+            chunk = records[start:start + per_datagram]
+            self._send(address, len(chunk), b"".join(chunk))
+
+    def _send(self, address: bytes, count: int, records: bytes):
+        datagram = DATAGRAM_HEADER.pack(DATAGRAM_VERSION, self.sequence, address, count) + records
+        # A datagram that cannot be sent still consumes its sequence number, receivers see it as a gap
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        try:
+            if metrics.ENABLED:
+                start = time.perf_counter()
+                self.sock.sendto(datagram, (self.group, self.port))
+                metrics.SEND_SECONDS.observe(time.perf_counter() - start, "multicast")
+            else:
+                self.sock.sendto(datagram, (self.group, self.port))
+            self.sent += 1
+        except OSError as e:
+            self.dropped += 1
+            if self.verbose:
+                print(f"[Multicast] Datagram {self.sequence - 1} dropped: {e}")
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "dropped": self.dropped, "sequence": self.sequence}
+
+    async def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import numpy as np
+from array import array
+from core import Reading, MeasurementBatch
+from core.models import RECORDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Columns keep the record typecodes (float64 timestamp, uint8 humidity, ...) instead of CSV text
+ARROW_TYPES = {"d": "float64", "B": "uint8", "h": "int16", "H": "uint16"}
+
+class ParquetTable:
+    def __init__(self, path: str, source: str, compression: str):
+        self.path = path
+        self.record = RECORDS[source]
+        self._reset()
+        fields = [pa.field(field, getattr(pa, ARROW_TYPES[code])()) for field, code in zip(self.record.FIELDS, self.record.TYPECODES)]
+        self.schema = pa.schema([*fields, pa.field("address", pa.dictionary(pa.int32(), pa.string()))])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def _reset(self):
+        # Written arrays may still be referenced by Arrow buffers, so fresh ones are started instead of clearing them
+        self.columns = {field: array(code) for field, code in zip(self.record.FIELDS, self.record.TYPECODES)}
+        self._arrays = tuple(self.columns.values())
+        self.addresses: list[str | None] = []
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def append(self, reading: Reading):
+        for column, value in zip(self._arrays, reading.data.astuple()):
+            column.append(value)
+        self.addresses.append(reading.address)
+
+    def extend(self, batch: MeasurementBatch):
+        for column, values in zip(self._arrays, batch.columns.values()):
+            column.extend(values)
+        self.addresses.extend([batch.address] * len(batch))
+
+    def write_row_group(self):
+        if not self.addresses:
+            return
+        arrays = [pa.array(np.frombuffer(column, dtype=column.typecode)) for column in self._arrays]
+        arrays.append(pa.array(self.addresses, pa.string()).dictionary_encode())
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._reset()
+
+    def close(self):
+        self.write_row_group()
+        self.writer.close()
+
+class ParquetLogger:
+    def __init__(self, filename: str, action: str, row_group_size: int = 65536, flush_interval: float | None = None,
+                 compression: str = "zstd"):
+        if pa is None:
+            raise RuntimeError("Parquet output requires pyarrow, install it with 'pip install pyarrow'.")
+        self.filename = filename
+        self.action = action
+        self.row_group_size = row_group_size
+        # Rows are only on disk once their row group is written, so the age of a row group is bounded too
+        self.flush_interval = flush_interval or 60.0
+        self.compression = compression
+        self.buffered = True
+        self.tables: dict[str, ParquetTable] = {}
+        self.flushed_at = time.monotonic()
+
+    def _table(self, source: str) -> ParquetTable:
+        table = self.tables.get(source)
+        if table is None:
+            table = self.tables[source] = ParquetTable(self._path(source), source, self.compression)
+        return table
+
+    def _path(self, source: str) -> str:
+        # One file per device type, Parquet files cannot be reopened for appending so append mode starts a new part
+        path = f"{self.filename}_{source.lower()}.parquet"
+        part = 1
+        while self.action == "a" and os.path.exists(path):
+            path = f"{self.filename}_{source.lower()}.{part}.parquet"
+            part += 1
+        return path
+
+    def sub(self, data: Reading):
+        table = self._table(data.source)
+        table.append(data)
+        self._flush_if_due(table)
+
+    def sub_batch(self, batch: MeasurementBatch):
+        table = self._table(batch.source)
+        table.extend(batch)
+        self._flush_if_due(table)
+
+    def _flush_if_due(self, table: ParquetTable):
+        if len(table) >= self.row_group_size:
+            table.write_row_group()
+        if time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        for table in self.tables.values():
+            table.write_row_group()
+        self.flushed_at = time.monotonic()
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables.clear()
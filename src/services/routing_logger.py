@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from core import Reading, MeasurementBatch
+from services.file_logger import FileLogger
+
+class RoutingLogger:
+    def __init__(self, directory: str, action: str = "w", max_open: int = 64, buffer_size: int | None = None,
+                 flush_interval: float | None = None, fsync: bool = False, rotate_size: int | None = None,
+                 rotate_every: str | None = None, compression: str | None = None):
+        self.directory = directory
+        self.action = action
+        self.max_open = max(1, max_open)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        # Rotation applies to every device file on its own, each keeps its own segments and manifest
+        self.rotate_size = rotate_size
+        self.rotate_every = rotate_every
+        self.compression = compression
+        # Closed segments of every device are compressed on one background thread
+        self.executor = ThreadPoolExecutor(1) if rotate_size or rotate_every else None
+        self.buffered = bool(buffer_size or flush_interval)
+        # One CSV file per (source, address), only the most recently used files are kept open.
+        # Evicted loggers are suspended, they keep their segment and reopen it on their next write.
+        self.writers: OrderedDict[tuple[str, str | None], FileLogger] = OrderedDict()
+        self.suspended: dict[tuple[str, str | None], FileLogger] = {}
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, source: str, address: str | None) -> str:
+        device = address.replace(":", "").upper() if address else "local"
+        return os.path.join(self.directory, f"{source.lower()}_{device}")
+
+    def _writer(self, source: str, address: str | None) -> FileLogger:
+        key = (source, address)
+        writer = self.writers.get(key)
+        if writer is not None:
+            self.writers.move_to_end(key)
+            return writer
+
+        if len(self.writers) >= self.max_open:
+            idle_key, idle = self.writers.popitem(last=False)
+            idle.suspend()
+            self.suspended[idle_key] = idle
+            self.evictions += 1
+
+        writer = self.suspended.pop(key, None)
+        if writer is None:
+            filename = self.path(source, address)
+            # A header is written whenever the file is new or empty
+            action = self.action
+            if not os.path.exists(filename + ".csv") or not os.path.getsize(filename + ".csv"):
+                action = "w"
+            writer = FileLogger(filename, action, self.buffer_size, self.flush_interval, self.fsync,
+                                self.rotate_size, self.rotate_every, self.compression, self.executor)
+        self.writers[key] = writer
+        return writer
+
+    def sub(self, data: Reading):
+        self._writer(data.source, data.address).sub(data)
+
+    def sub_batch(self, batch: MeasurementBatch):
+        self._writer(batch.source, batch.address).sub_batch(batch)
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    async def flush_periodically(self):
+        interval = self.flush_interval or 5.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for writer in self.writers.values():
+                if now - writer.flushed_at >= interval:
+                    writer.flush()
+
+    def close(self):
+        while self.writers:
+            _key, writer = self.writers.popitem(last=False)
+            writer.close()
+        for writer in self.suspended.values():
+            writer.close()
+        self.suspended.clear()
+        if self.executor:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,116 @@
+import struct
+import numpy as np
+from multiprocessing import shared_memory
+from core import Reading, MeasurementBatch
+from core.models import RECORDS
+from core.wire import SOURCE_IDS, pack_address
+
+# One shared memory ring per device type, named "<name>_<source>", e.g. "xiaomi_monitor_xiaomi".
+# Layout: a 64-byte header (magic, version, source id, slot size, capacity, then the number of records written
+# at offset 16) followed by `capacity` fixed-size slots. Each slot starts with its own sequence number:
+# odd while the writer fills it, 2 * n + 2 once record n is complete, so readers can detect torn or lapped slots.
+RING_MAGIC = b"XMRB"
+RING_VERSION = 1
+RING_HEADER = struct.Struct("<4sBBHI")
+RING_COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 16
+DATA_OFFSET = 64
+
+class SharedRing:
+    def __init__(self, name: str, source: str, capacity: int):
+        record = RECORDS[source]
+        self.name = name
+        self.capacity = capacity
+        # Fields follow the slot sequence number and the address comes last, keeping float64 columns aligned
+        self.record = struct.Struct("<" + "".join(record.TYPECODES) + "6s")
+        self.slot_size = -(-(RING_COUNT.size + self.record.size) // 8) * 8
+        self.dtype = np.dtype({
+            "names": ["seq", *record.FIELDS, "address"],
+            "formats": ["<u8", *(f"<{code}" for code in record.TYPECODES), "S6"],
+            "offsets": [0, *(RING_COUNT.size + struct.calcsize("<" + "".join(record.TYPECODES[:i])) for i in range(len(record.FIELDS) + 1))],
+            "itemsize": self.slot_size,
+        })
+
+        size = DATA_OFFSET + capacity * self.slot_size
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a process that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.slots = np.ndarray((capacity,), self.dtype, buffer=self.buf, offset=DATA_OFFSET)
+        self.count = 0
+        RING_HEADER.pack_into(self.buf, 0, RING_MAGIC, RING_VERSION, SOURCE_IDS[source], self.slot_size, capacity)
+        RING_COUNT.pack_into(self.buf, COUNT_OFFSET, 0)
+
+    def write(self, address: bytes, values: tuple):
+        n = self.count
+        offset = DATA_OFFSET + n % self.capacity * self.slot_size
+        RING_COUNT.pack_into(self.buf, offset, 2 * n + 1)
+        self.record.pack_into(self.buf, offset + RING_COUNT.size, *values, address)
+        RING_COUNT.pack_into(self.buf, offset, 2 * n + 2)
+        # Readers only look at slots below the published count
+        self.count = n + 1
+        RING_COUNT.pack_into(self.buf, COUNT_OFFSET, self.count)
+
+    def write_batch(self, address: bytes, columns: dict):
+        total = len(columns["timestamp"])
+        # Only the last `capacity` readings of an oversized batch can be kept
+        skip = max(0, total - self.capacity)
+        self.count += skip
+        done = skip
+        while done < total:
+            start = self.count % self.capacity
+            length = min(total - done, self.capacity - start)
+            slots = self.slots[start:start + length]
+            sequence = 2 * np.arange(self.count, self.count + length, dtype=np.uint64)
+            slots["seq"] = sequence + 1
+            for field, values in columns.items():
+                slots[field] = np.frombuffer(values, dtype=values.typecode)[done:done + length]
+            slots["address"] = address
+            slots["seq"] = sequence + 2
+            self.count += length
+            done += length
+            RING_COUNT.pack_into(self.buf, COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.slots = None
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedMemoryPublisher:
+    def __init__(self, name: str = "xiaomi_monitor", capacity: int = 65536, verbose: bool = False):
+        self.name = name
+        self.capacity = capacity
+        self.verbose = verbose
+        self.rings: dict[str, SharedRing] = {}
+
+    async def start(self):
+        # Every ring exists from the start so readers can attach before the first reading arrives
+        for source in RECORDS:
+            self.rings[source] = SharedRing(f"{self.name}_{source.lower()}", source, self.capacity)
+        if self.verbose:
+            print(f"[SHM] Publishing to {', '.join(ring.name for ring in self.rings.values())}.")
+        return self
+
+    def sub(self, data: Reading):
+        ring = self.rings.get(data.source)
+        if ring:
+            ring.write(pack_address(data.address), data.data.astuple())
+
+    def sub_batch(self, batch: MeasurementBatch):
+        ring = self.rings.get(batch.source)
+        if ring and len(batch):
+            ring.write_batch(pack_address(batch.address), batch.columns)
+
+    def stats(self) -> dict:
+        return {source: ring.count for source, ring in self.rings.items()}
+
+    async def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings.clear()
@@ -1,57 +1,147 @@
-import json
+import time
 import asyncio
-from core import Measurement
-from typing import Set
+from core import Reading, metrics
+from core.queues import BoundedQueue, DROP_OLDEST
+from core.wire import FRAMINGS
+from typing import Dict
+
+# Clients may switch framing by sending "FRAMING <json|binary>\n", the server replies with the same
+# line once every message queued after it uses the new framing.
+FRAMING_COMMAND = b"FRAMING "
+
+class SocketChannel:
+    __slots__ = ("writer", "address", "queue", "task", "framing")
+
+    def __init__(self, writer: asyncio.StreamWriter, queue: BoundedQueue, framing: str):
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.queue = queue
+        self.task: asyncio.Task | None = None
+        self.framing = FRAMINGS[framing]
 
 class SocketServer:
-    def __init__(self, host: str, port: int, verbose: bool = False):
+    def __init__(self, host: str, port: int, verbose: bool = False, queue_size: int = 1024, overflow: str = DROP_OLDEST,
+                 framing: str = "json"):
+        if framing not in FRAMINGS:
+            raise ValueError(f"Unknown framing '{framing}', expected one of {list(FRAMINGS)}")
         self.host = host
         self.port = port
-        self.clients: Set[asyncio.StreamWriter] = set()
+        self.clients: Dict[asyncio.StreamWriter, SocketChannel] = {}
         self.server: asyncio.Server | None = None
         self.verbose = verbose
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.framing = framing
+        self.dropped = 0
+        self.disconnected = 0
+        self.evicted = 0
 
     async def start(self):
         # print(f"[Socket] Listening on {self.host}:{self.port}...")
         self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        metrics.QUEUE_DEPTH.track(lambda: sum(len(client.queue) for client in self.clients.values()), "socket")
+        metrics.QUEUE_DROPPED.track(lambda: self.stats()["dropped"], "socket")
         return self.server
-    
+
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        address = writer.get_extra_info("peername")
+        client = SocketChannel(writer, BoundedQueue(self.queue_size, self.overflow), self.framing)
         if self.verbose:
-            print(f"[Socket] Client {address} connected.")
-        self.clients.add(writer)
+            print(f"[Socket] Client {client.address} connected.")
+        client.task = asyncio.create_task(self._write_loop(client))
+        self.clients[writer] = client
 
+        buffer = b""
         try:
             while True:
                 data = await reader.read(1024)
                 if not data:
                     break
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    self._handle_command(client, line.strip())
+                buffer = buffer[-1024:]
         except (asyncio.CancelledError, ConnectionResetError, OSError):
-            if self.verbose:
-                print(f"[Socket] Client {address} disconnected.")
             pass
         except Exception as e:
             print(f"[Socket] Error occurred:", e)
+        finally:
+            self._remove_client(client)
+            if self.verbose:
+                print(f"[Socket] Client {client.address} disconnected.")
 
-    async def broadcast(self, data: Measurement):
-        payload = json.dumps(data.model_dump()).encode('utf-8')
-        for client in self.clients.copy():
-            try:
-                client.write(payload)
-                await client.drain()
-            except Exception:
-                self.clients.discard(client)
+    async def _write_loop(self, client: SocketChannel):
+        # Each client drains its own queue, so a slow consumer only delays itself
+        try:
+            while True:
+                payload = await client.queue.get()
+                if metrics.ENABLED:
+                    start = time.perf_counter()
+                    client.writer.write(payload)
+                    await client.writer.drain()
+                    metrics.SEND_SECONDS.observe(time.perf_counter() - start, "socket")
+                else:
+                    client.writer.write(payload)
+                    await client.writer.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.CLIENTS_DROPPED.inc("socket")
+            self._remove_client(client)
+
+    def _handle_command(self, client: SocketChannel, line: bytes):
+        if line.startswith(FRAMING_COMMAND):
+            framing = line[len(FRAMING_COMMAND):].decode(errors="replace")
+            if framing in FRAMINGS:
+                client.framing = FRAMINGS[framing]
+                self._offer(client, line + b"\n")
+                if self.verbose:
+                    print(f"[Socket] Client {client.address} switched to {framing} framing.")
+
+    def broadcast(self, data: Reading):
+        for client in list(self.clients.values()):
+            # Payloads are cached on the reading, so each framing is encoded once per broadcast
+            self._offer(client, data.encode(client.framing))
+
+    def _offer(self, client: SocketChannel, payload: bytes):
+        if not client.queue.offer(payload):
+            if self.verbose:
+                print(f"[Socket] Client {client.address} disconnected, send queue overflowed.")
+            self.evicted += 1
+            metrics.CLIENTS_DROPPED.inc("socket")
+            self._remove_client(client)
 
-    async def sub(self, data: Measurement):
-        await self.broadcast(data)
+    def sub(self, data: Reading):
+        self.broadcast(data)
+
+    def stats(self) -> dict:
+        return {
+            "clients": {str(client.address): client.queue.stats() for client in self.clients.values()},
+            "dropped": self.dropped + sum(client.queue.dropped for client in self.clients.values()),
+            "disconnected": self.disconnected,
+            "evicted": self.evicted,
+        }
+
+    def _remove_client(self, client: SocketChannel):
+        if self.clients.pop(client.writer, None) is None:
+            return
+        self.dropped += client.queue.dropped
+        self.disconnected += 1
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+        client.writer.close()
 
     async def close(self):
-        for client in self.clients:
-            client.close()
-            await client.wait_closed()
+        for client in list(self.clients.values()):
+            self._remove_client(client)
+            try:
+                await client.writer.wait_closed()
+            except Exception:
+                pass
         self.clients.clear()
+        metrics.QUEUE_DEPTH.untrack("socket")
+        metrics.QUEUE_DROPPED.untrack("socket")
 
         if self.server:
             self.server.close()
-            await self.server.wait_closed()
\ No newline at end of file
+            await self.server.wait_closed()
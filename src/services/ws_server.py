@@ -1,60 +1,161 @@
-import asyncio
 import json
+import time
+import asyncio
 import websockets
-from core import Measurement
+from core import Reading, metrics
+from core.models import RECORDS
+
+# Clients may send {"type": "subscribe", "devices": [...], "sources": [...], "max_rate": 5} at any time.
+# Missing keys mean no filter. Clients with a coalescing window (server-wide or from `max_rate`) receive
+# JSON arrays of the readings published during each window instead of one frame per reading.
+MAX_PENDING = 4096
+
+class WebSocketChannel:
+    __slots__ = ("websocket", "devices", "sources", "window", "pending", "ready", "task", "dropped")
+
+    def __init__(self, websocket: websockets.ServerConnection, window: float):
+        self.websocket = websocket
+        self.devices: set[str] | None = None
+        self.sources: set[str] | None = None
+        self.window = window
+        self.pending: list[bytes] = []
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.dropped = 0
+
+    def matches(self, reading: Reading) -> bool:
+        return (self.sources is None or reading.source in self.sources) and (self.devices is None or (reading.address or "").upper() in self.devices)
 
 class WebSocketServer:
-    def __init__(self, host: str, port: int, verbose: bool = False):
+    def __init__(self, host: str, port: int, verbose: bool = False, coalesce: float | None = None, compression: bool = True):
         self.host = host
         self.port = port
         self.verbose = verbose
-        self.clients = set()
+        self.coalesce = coalesce or 0.0
+        self.compression = compression
+        self.clients: dict[websockets.ServerConnection, WebSocketChannel] = {}
         self.server = None
 
     async def handle_client(self, websocket: websockets.ServerConnection):
-        self.clients.add(websocket)
+        client = WebSocketChannel(websocket, self.coalesce)
+        self._update_window(client, self.coalesce)
+        self.clients[websocket] = client
         if self.verbose:
             print(f"[WS] Client {websocket.remote_address} connected.")
 
         try:
-            async for _ in websocket:
-                pass
+            async for message in websocket:
+                await self._handle_message(client, message)
+        except websockets.ConnectionClosed:
+            pass
         except Exception as e:
             print(f"Error occured:", e)
         finally:
-            self.clients.remove(websocket)
+            self._remove_client(client)
             if self.verbose:
                 print(f"[WS] Client {websocket.remote_address} disconnected.")
 
+    async def _handle_message(self, client: WebSocketChannel, message: str | bytes):
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(request, dict) or request.get("type") != "subscribe":
+            return
+
+        devices, sources, max_rate = request.get("devices"), request.get("sources"), request.get("max_rate")
+        try:
+            client.devices = {str(device).upper() for device in devices} if devices else None
+            client.sources = {str(source) for source in sources} & set(RECORDS) if sources else None
+            window = max(self.coalesce, 1 / float(max_rate)) if max_rate else self.coalesce
+        except (TypeError, ValueError, ZeroDivisionError):
+            await client.websocket.send(json.dumps({"type": "error", "message": "Invalid subscribe message."}))
+            return
+        self._update_window(client, window)
+        await client.websocket.send(json.dumps({
+            "type": "subscribed",
+            "devices": sorted(client.devices) if client.devices is not None else None,
+            "sources": sorted(client.sources) if client.sources is not None else None,
+            "window": client.window,
+        }))
+        if self.verbose:
+            print(f"[WS] Client {client.websocket.remote_address} subscribed to devices={devices} sources={sources} max_rate={max_rate}.")
+
+    def _update_window(self, client: WebSocketChannel, window: float):
+        client.window = window
+        if window and client.task is None:
+            client.task = asyncio.create_task(self._flush_loop(client))
+        elif not window and client.task is not None:
+            client.task.cancel()
+            client.task = None
+            client.pending = []
+            client.ready.clear()
+
     async def start(self):
         # print(f"[WS] Starting server on {self.host}:{self.port}")
-        self.server = await websockets.serve(self.handle_client, self.host, self.port)
-    
-    async def broadcast(self, data: Measurement):
+        self.server = await websockets.serve(self.handle_client, self.host, self.port, compression="deflate" if self.compression else None)
+
+    async def broadcast(self, data: Reading):
         if not self.clients:
             return
-        payload = json.dumps(data.model_dump()).encode('utf-8')
+        payload = data.payload()
 
-        async def _safe_send(websocket, payload):
-            try:
-                await websocket.send(payload)
-            except:
-                self.clients.remove(websocket)
+        immediate = []
+        for client in list(self.clients.values()):
+            if not client.matches(data):
+                continue
+            if client.window:
+                if len(client.pending) >= MAX_PENDING:
+                    del client.pending[0]
+                    client.dropped += 1
+                client.pending.append(payload)
+                client.ready.set()
+            else:
+                immediate.append(client)
+
+        if immediate:
+            await asyncio.gather(*[self._safe_send(client, payload) for client in immediate], return_exceptions=True)
+
+    async def _flush_loop(self, client: WebSocketChannel):
+        # One frame per window at most, holding every reading published during the window
+        while True:
+            await client.ready.wait()
+            await asyncio.sleep(client.window)
+            frame = b"[" + b",".join(client.pending) + b"]"
+            client.pending = []
+            client.ready.clear()
+            await self._safe_send(client, frame)
+            if client.websocket not in self.clients:
+                # The send failed and removed the client
+                return
+
+    async def _safe_send(self, client: WebSocketChannel, payload: bytes):
+        try:
+            if metrics.ENABLED:
+                start = time.perf_counter()
+                await client.websocket.send(payload)
+                metrics.SEND_SECONDS.observe(time.perf_counter() - start, "websocket")
+            else:
+                await client.websocket.send(payload)
+        except Exception:
+            if client.websocket in self.clients:
+                metrics.CLIENTS_DROPPED.inc("websocket")
+            self._remove_client(client)
 
-        await asyncio.gather(
-            *[
-                _safe_send(client, payload) for client in list(self.clients)
-            ],
-            return_exceptions=True
-        )
+    def _remove_client(self, client: WebSocketChannel):
+        self.clients.pop(client.websocket, None)
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+        client.task = None
 
-    async def sub(self, data: Measurement):
+    async def sub(self, data: Reading):
         await self.broadcast(data)
 
     async def close(self):
-        for client in list(self.clients):
+        for client in list(self.clients.values()):
+            self._remove_client(client)
             try:
-                await client.close()
+                await client.websocket.close()
             except:
                 pass
         self.clients.clear()
@@ -14,8 +14,8 @@ from PySide6.QtWidgets import (QApplication, QWidget, QTabWidget, QPushButton, Q
                                QLabel, QSpinBox, QFrame, QListWidget, QTextEdit, QMessageBox, QBoxLayout, QLineEdit,
                                QComboBox, QGroupBox, QFormLayout, QFileDialog, QCheckBox)
 
-from core import SensorPipeline, Measurement
-from services import FileLogger, APIServer, SocketServer, WebSocketServer
+from core import SensorPipeline, Reading
+from services import FileLogger, ParquetLogger, APIServer, SocketServer, WebSocketServer
 
 MI_DEVICE_NAME = "LYWSD03MMC"
 O2_DEVICE_NAME = "O2Ring"
@@ -34,7 +34,7 @@ class DeviceTab(QWidget):
         self._connected = False
         self._device_info: list[str] = []
 
-        self.logger: FileLogger | None = None
+        self.logger: FileLogger | ParquetLogger | None = None
         self.services: Dict[str, Union[APIServer, SocketServer, WebSocketServer]] = {
             "api": None,
             "tcp": None,
@@ -165,7 +165,7 @@ class DeviceTab(QWidget):
         # Right Section
         self.file_name = QLineEdit("monitor_data")
         self.file_extension = QComboBox()
-        self.file_extension.addItems([".csv"])
+        self.file_extension.addItems([".csv", ".parquet"])
         self.file_mode = QComboBox()
         self.file_mode.addItems(["write", "append"])
         self.file_browse_button = QPushButton("Browse...")
@@ -324,7 +324,19 @@ class DeviceTab(QWidget):
         self.file_group.setEnabled(False)
         (style, overlay) = self._button_start_loading(self.connect_button, self.connect_spinner)
 
-        self.logger = FileLogger(self.file_name.text(), self.file_mode.currentText()[0])
+        try:
+            if self.file_extension.currentText() == ".parquet":
+                self.logger = ParquetLogger(self.file_name.text(), self.file_mode.currentText()[0])
+            else:
+                self.logger = FileLogger(self.file_name.text(), self.file_mode.currentText()[0])
+        except Exception as e:
+            QMessageBox.critical(self, "Error occurred", str(e))
+            self.devices.setEnabled(True)
+            self.scan_button.setEnabled(True)
+            self.interval_spin.setEnabled(True)
+            self.file_group.setEnabled(True)
+            self._button_stop_loading(self.connect_button, self.connect_spinner, overlay, style, "Connect")
+            return
         self.pipeline.hub.register(self.logger.sub)
         self.pipeline.hub.register(self.notify_sub)
 
@@ -594,7 +606,7 @@ class DeviceTab(QWidget):
             self.data_log.append(failure.format(error=e) + "\n")
 
 
-    def notify_sub(self, data: Measurement):
+    def notify_sub(self, data: Reading):
         if data.source == "XIAOMI":
             data_dict = {
                 "source": data.source,